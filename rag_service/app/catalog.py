@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import httpx
+
+from .config import Settings, settings
+from .state import shared_state
+
+
+# Known-good models, searchable offline; remote search results are merged in
+CURATED: List[dict] = [
+    {
+        "name": "llama3.2:3b",
+        "description": "Latest Llama 3.2 model, 3B parameters - good balance of speed and quality",
+        "family": "llama",
+        "parameter_size": "3B",
+        "size": "~2GB",
+    },
+    {
+        "name": "llama3.2:1b",
+        "description": "Smallest Llama 3.2 model, 1B parameters - fastest option",
+        "family": "llama",
+        "parameter_size": "1B",
+        "size": "~1GB",
+    },
+    {
+        "name": "llama3.1:8b",
+        "description": "Llama 3.1 - 8B parameters, high quality responses",
+        "family": "llama",
+        "parameter_size": "8B",
+        "size": "~4.9GB",
+    },
+    {
+        "name": "phi3:mini",
+        "description": "Microsoft Phi-3 Mini - efficient and fast for chat",
+        "family": "phi3",
+        "parameter_size": "3.8B",
+        "size": "~2.2GB",
+    },
+    {
+        "name": "gemma2:2b",
+        "description": "Google Gemma 2 - 2B parameters, optimized for efficiency",
+        "family": "gemma2",
+        "parameter_size": "2B",
+        "size": "~1.6GB",
+    },
+    {
+        "name": "qwen2:1.5b",
+        "description": "Qwen 2 - 1.5B parameters, multilingual support",
+        "family": "qwen2",
+        "parameter_size": "1.5B",
+        "size": "~934MB",
+    },
+    {
+        "name": "qwen2:7b",
+        "description": "Qwen 2 - 7B parameters, larger multilingual model",
+        "family": "qwen2",
+        "parameter_size": "7B",
+        "size": "~4.4GB",
+    },
+    {
+        "name": "deepseek-r1:latest",
+        "description": "DeepSeek R1 - Advanced reasoning model with chain of thought",
+        "family": "deepseek",
+        "parameter_size": "Unknown",
+        "size": "~Variable",
+        "tags": ["reasoning", "chain-of-thought"],
+    },
+    {
+        "name": "deepseek-r1:1.5b",
+        "description": "DeepSeek R1 - 1.5B parameters, compact reasoning model",
+        "family": "deepseek",
+        "parameter_size": "1.5B",
+        "size": "~1.5GB",
+        "tags": ["reasoning", "small"],
+    },
+    {
+        "name": "deepseek-r1:7b",
+        "description": "DeepSeek R1 - 7B parameters, powerful reasoning capabilities",
+        "family": "deepseek",
+        "parameter_size": "7B",
+        "size": "~4.3GB",
+        "tags": ["reasoning", "large"],
+    },
+    {
+        "name": "deepseek-coder:1.3b",
+        "description": "DeepSeek Coder - Specialized for code generation and understanding",
+        "family": "deepseek",
+        "parameter_size": "1.3B",
+        "size": "~1.3GB",
+        "tags": ["coding", "programming"],
+    },
+    {
+        "name": "codellama:7b",
+        "description": "Code Llama - Meta's code-specialized language model",
+        "family": "llama",
+        "parameter_size": "7B",
+        "size": "~3.8GB",
+        "tags": ["coding", "programming"],
+    },
+    {
+        "name": "mistral:7b",
+        "description": "Mistral 7B - Efficient and powerful general-purpose model",
+        "family": "mistral",
+        "parameter_size": "7B",
+        "size": "~4.1GB",
+    },
+    {
+        "name": "neural-chat:7b",
+        "description": "Intel's neural chat model optimized for conversations",
+        "family": "neural-chat",
+        "parameter_size": "7B",
+        "size": "~4.1GB",
+        "tags": ["chat", "conversation"],
+    },
+]
+# Popular models that work well for RAG, in the order /models/available lists them
+POPULAR = ("llama3.2:3b", "llama3.2:1b", "phi3:mini", "gemma2:2b", "qwen2:1.5b", "llama3.1:8b")
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_MAX_PREFIX = 16
+_INSTALLED_KEY = "models:installed"
+_INSTALLED_ERROR_KEY = "models:installed_error"
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class ModelCatalog:
+    """Searchable model list: curated entries plus cached ollama.com search results.
+
+    Searches are answered from an in-memory prefix index. A query whose remote
+    results are missing or older than catalog_ttl triggers a background fetch that
+    is merged into the index and the on-disk cache for later searches.
+    """
+
+    def __init__(self, path: Path, cfg: Settings = settings):
+        self.path = path
+        self.cfg = cfg
+        self._entries: Dict[str, dict] = {}
+        self._index: Dict[str, Set[str]] = {}
+        self._queries: Dict[str, float] = {}
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._retry_at = 0.0
+        for entry in CURATED:
+            self._add(entry)
+        self._load()
+
+    def _add(self, entry: dict) -> None:
+        name = entry["name"]
+        current = self._entries.get(name, {})
+        entry = {**current, **{k: v for k, v in entry.items() if v not in (None, "", [])}}
+        self._entries[name] = entry
+        words = set(_tokens(name)) | set(_tokens(entry.get("description", ""))) | set(_tokens(entry.get("family", "")))
+        for tag in entry.get("tags") or []:
+            words.update(_tokens(tag))
+        for word in words:
+            for i in range(1, min(len(word), _MAX_PREFIX) + 1):
+                self._index.setdefault(word[:i], set()).add(name)
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        for entry in data.get("models", []):
+            if entry.get("name"):
+                self._add(entry)
+        self._queries.update(data.get("queries", {}))
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        data = {"models": list(self._entries.values()), "queries": self._queries}
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def get(self, name: str) -> Optional[dict]:
+        return self._entries.get(name)
+
+    def popular(self) -> List[dict]:
+        return [self._entries[n] for n in POPULAR]
+
+    def search(self, query: str, limit: int = 20) -> List[dict]:
+        words = _tokens(query)
+        if not words:
+            return list(self._entries.values())[:limit]
+        names = set.intersection(*(self._index.get(w[:_MAX_PREFIX], set()) for w in words))
+        q = query.strip().lower()
+        ranked = sorted(
+            names,
+            key=lambda n: (not n.startswith(q), -(self._entries[n].get("pulls") or 0), n),
+        )
+        return [self._entries[n] for n in ranked[:limit]]
+
+    def refresh(self, query: str) -> None:
+        """Fetch remote results for the query in the background if the cached ones are stale."""
+        q = query.strip().lower()
+        if not self.cfg.catalog_remote_url or len(q) < 2 or q in self._pending:
+            return
+        now = time.time()
+        if now < self._retry_at or now - self._queries.get(q, 0) < self.cfg.catalog_ttl:
+            return
+        self._pending[q] = asyncio.create_task(self._fetch(q))
+
+    async def _fetch(self, q: str) -> None:
+        try:
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                r = await client.get(self.cfg.catalog_remote_url, params={"q": q, "limit": 50})
+                r.raise_for_status()
+                data = r.json()
+            for m in data.get("models", []):
+                if m.get("name"):
+                    self._add(
+                        {
+                            "name": m["name"],
+                            "description": m.get("description"),
+                            "tags": m.get("tags"),
+                            "is_official": m.get("is_official"),
+                            "pulls": m.get("pulls"),
+                            "updated_at": m.get("updated_at"),
+                        }
+                    )
+            self._queries[q] = time.time()
+            self._save()
+        except Exception as e:
+            # Offline or rate limited: serve the local index and back off
+            self._retry_at = time.time() + 60.0
+            print(f"Model catalog refresh failed ({e}); using cached catalog")
+        finally:
+            self._pending.pop(q, None)
+
+
+catalog = ModelCatalog(settings.data_dir / "model_catalog.json")
+
+
+async def installed_models(refresh: bool = False) -> List[dict]:
+    """Models Ollama has installed, cached in shared state for installed_models_ttl.
+
+    Raises when Ollama is unreachable; the failure is cached briefly too, so an
+    offline node does not stall every search on a connect timeout.
+    """
+    if not refresh:
+        cached = shared_state.get(_INSTALLED_KEY)
+        if cached is not None:
+            return cached
+        error = shared_state.get(_INSTALLED_ERROR_KEY)
+        if error is not None:
+            raise RuntimeError(error)
+    try:
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            r = await client.get(f"{settings.llm_base_url.rstrip('/')}/api/tags")
+            r.raise_for_status()
+            data = r.json()
+    except Exception as e:
+        shared_state.set(_INSTALLED_ERROR_KEY, str(e), ttl=5.0)
+        raise
+    models = data.get("models", [])
+    shared_state.set(_INSTALLED_KEY, models, ttl=settings.installed_models_ttl)
+    shared_state.delete(_INSTALLED_ERROR_KEY)
+    return models
+
+
+async def installed_names() -> Set[str]:
+    try:
+        return {m.get("name") for m in await installed_models()}
+    except Exception:
+        return set()
+
+
+def invalidate_installed() -> None:
+    shared_state.delete(_INSTALLED_KEY)
+    shared_state.delete(_INSTALLED_ERROR_KEY)
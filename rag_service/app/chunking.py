@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import re
+import threading
+from functools import lru_cache
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+from .config import settings
+
+
+# Markdown ATX headings start a new section
+_HEADING_RE = re.compile(r"^#{1,6}[ \t]+\S.*$", re.MULTILINE)
+# Splitters from coarse to fine: paragraphs, sentences/lines, words
+_SPLITTERS = (
+    re.compile(r"\n\s*\n"),
+    re.compile(r"(?<=[.!?;:。！？])\s+|\s*\n\s*"),
+    re.compile(r"\s+"),
+)
+# Separator placed before a piece, by the level of the boundary it follows
+_JOINERS = ("\n\n", " ", " ", "")
+_PUNCTUATION = ".,;:!?()[]\"'/-"
+
+TokenCounter = Callable[[Sequence[str]], List[int]]
+# (text, token count, joiner index)
+Piece = Tuple[str, int, int]
+
+
+def approx_token_counts(texts: Sequence[str]) -> List[int]:
+    """Word plus punctuation count; close to WordPiece counts for prose."""
+    return [len(t.split()) + sum(t.count(c) for c in _PUNCTUATION) for t in texts]
+
+
+@lru_cache(maxsize=4)
+def token_counter(model_name: str) -> TokenCounter:
+    """Batch token counter for the given model, falling back to an approximation."""
+    if model_name == "approx":
+        return approx_token_counts
+    try:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        # Counting only; silence the "longer than max length" warning
+        tokenizer.model_max_length = int(1e12)
+    except Exception as e:
+        print(f"Tokenizer for {model_name} unavailable ({e}), approximating token counts")
+        return approx_token_counts
+
+    # Files are chunked on several ingest threads; fast tokenizers are not reentrant
+    lock = threading.Lock()
+
+    def count(texts: Sequence[str]) -> List[int]:
+        if not texts:
+            return []
+        with lock:
+            enc = tokenizer(
+                list(texts),
+                add_special_tokens=False,
+                return_attention_mask=False,
+                return_token_type_ids=False,
+            )
+        return [len(ids) for ids in enc["input_ids"]]
+
+    return count
+
+
+def default_token_counter() -> TokenCounter:
+    return token_counter(settings.chunk_tokenizer or settings.embedding_model)
+
+
+def _sections(text: str) -> Iterator[str]:
+    start = 0
+    for m in _HEADING_RE.finditer(text):
+        if m.start() > start:
+            yield text[start:m.start()]
+        start = m.start()
+    yield text[start:]
+
+
+def _pieces(
+    text: str, max_tokens: int, count: TokenCounter, level: int = 0, lead: int = 0
+) -> Iterator[Piece]:
+    """Split text into pieces of at most max_tokens, preferring coarse boundaries."""
+    parts = [p for p in (s.strip() for s in _SPLITTERS[level].split(text)) if p]
+    for i, (part, n) in enumerate(zip(parts, count(parts))):
+        joiner = lead if i == 0 else level
+        if n <= max_tokens:
+            yield part, n, joiner
+        elif level + 1 < len(_SPLITTERS):
+            yield from _pieces(part, max_tokens, count, level + 1, joiner)
+        else:
+            # A single "word" longer than the budget (URLs, base64, tables); cut by characters
+            step = max(1, len(part) * max_tokens // n)
+            cuts = [part[j:j + step] for j in range(0, len(part), step)]
+            for j, (cut, m) in enumerate(zip(cuts, count(cuts))):
+                yield cut, m, joiner if j == 0 else len(_SPLITTERS)
+
+
+def _join(buf: List[Piece]) -> str:
+    out = [buf[0][0]]
+    for text, _, joiner in buf[1:]:
+        out.append(_JOINERS[joiner])
+        out.append(text)
+    return "".join(out)
+
+
+def _fit(buf: List[Piece], carried: int, max_tokens: int, count: TokenCounter) -> Tuple[List[Piece], List[Piece]]:
+    """Split buf into a chunk whose joined text is within max_tokens and the pieces left over.
+
+    Pieces are counted on their own, and subword tokens can merge or split across
+    the separators, so the joined text is recounted. Trailing pieces move on to
+    the next chunk, then the carried overlap is dropped; a chunk always keeps at
+    least one piece it does not share with the previous one.
+    """
+    keep, spill = list(buf), []
+    while len(keep) > 1 and count([_join(keep)])[0] > max_tokens:
+        if len(keep) > carried + 1:
+            spill.append(keep.pop())
+        else:
+            keep.pop(0)
+            carried -= 1
+    return keep, spill[::-1]
+
+
+def chunk_text(
+    text: str,
+    max_tokens: Optional[int] = None,
+    overlap_tokens: Optional[int] = None,
+    count: Optional[TokenCounter] = None,
+) -> List[str]:
+    """Split text on headings, paragraphs, sentences and words into token-bounded chunks.
+
+    Pieces are packed greedily, so the work is linear in the input size. A heading
+    closes the current chunk once it is at least half full; overlap is only carried
+    between chunks of the same section.
+    """
+    max_tokens = max_tokens or settings.chunk_max_tokens
+    overlap_tokens = settings.chunk_overlap_tokens if overlap_tokens is None else overlap_tokens
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    count = count or default_token_counter()
+
+    chunks: List[str] = []
+    buf: List[Piece] = []
+    size = 0
+    carried = 0  # leading pieces of buf repeated from the previous chunk
+    for section in _sections(text):
+        if buf and size >= max_tokens // 2:
+            while buf:
+                chunk, buf = _fit(buf, carried, max_tokens, count)
+                chunks.append(_join(chunk))
+                carried = 0
+            size = 0
+        pieces = _pieces(section, max_tokens, count)
+        queue: List[Piece] = []  # pieces pushed back by _fit, ahead of the rest
+        while (piece := queue.pop(0) if queue else next(pieces, None)) is not None:
+            n = piece[1]
+            if buf and size + n > max_tokens:
+                chunk, spill = _fit(buf, carried, max_tokens, count)
+                chunks.append(_join(chunk))
+                queue[:0] = [*spill, piece]
+                n = queue[0][1]
+                # Carry trailing pieces forward as overlap
+                tail: List[Piece] = []
+                tail_size = 0
+                for prev in reversed(chunk):
+                    if tail_size + prev[1] > overlap_tokens or tail_size + prev[1] + n > max_tokens:
+                        break
+                    tail.append(prev)
+                    tail_size += prev[1]
+                buf, size, carried = tail[::-1], tail_size, len(tail)
+                continue
+            buf.append(piece)
+            size += n
+    while buf:
+        chunk, buf = _fit(buf, carried, max_tokens, count)
+        chunks.append(_join(chunk))
+        carried = 0
+    return chunks
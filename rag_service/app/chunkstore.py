@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+
+# SQLite's default limit on host parameters per statement is 999
+_IN_BATCH = 900
+
+
+class ChunkStore:
+    """Chunk text keyed by Qdrant point id, zlib-compressed in SQLite.
+
+    Qdrant only keeps ids and small metadata; the chat path fetches the text of
+    the final top-k hits in one query.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS chunks (id INTEGER PRIMARY KEY, text BLOB NOT NULL)")
+
+    def put_many(self, ids: Sequence[int], texts: Sequence[str]) -> None:
+        rows = [(int(i), zlib.compress(t.encode("utf-8"))) for i, t in zip(ids, texts)]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO chunks (id, text) VALUES (?, ?)", rows)
+
+    def get_many(self, ids: Iterable[int]) -> Dict[int, str]:
+        ids = [int(i) for i in ids]
+        out: Dict[int, str] = {}
+        with self._lock:
+            for start in range(0, len(ids), _IN_BATCH):
+                batch = ids[start:start + _IN_BATCH]
+                marks = ",".join("?" * len(batch))
+                for row_id, blob in self._conn.execute(f"SELECT id, text FROM chunks WHERE id IN ({marks})", batch):
+                    out[row_id] = zlib.decompress(blob).decode("utf-8")
+        return out
+
+    def delete_many(self, ids: Iterable[int]) -> None:
+        rows: List[tuple] = [(int(i),) for i in ids]
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", rows)
+
+    def iter_raw(self, batch: int = 1000) -> Iterator[List[Tuple[int, bytes]]]:
+        """All rows in id order as (id, compressed text), batch by batch."""
+        last = None
+        while True:
+            with self._lock:
+                if last is None:
+                    rows = self._conn.execute("SELECT id, text FROM chunks ORDER BY id LIMIT ?", (batch,)).fetchall()
+                else:
+                    rows = self._conn.execute(
+                        "SELECT id, text FROM chunks WHERE id > ? ORDER BY id LIMIT ?", (last, batch)
+                    ).fetchall()
+            if not rows:
+                return
+            yield rows
+            last = rows[-1][0]
+
+    def put_raw(self, rows: Sequence[Tuple[int, bytes]]) -> None:
+        """Store rows from iter_raw as they are, without recompressing."""
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO chunks (id, text) VALUES (?, ?)", rows)
+
+    def replace_raw(self, batches: Iterable[Sequence[Tuple[int, bytes]]]) -> int:
+        """Replace every row with the given batches in one transaction; a failing batch keeps the old rows."""
+        n = 0
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks")
+            for rows in batches:
+                self._conn.executemany("INSERT OR REPLACE INTO chunks (id, text) VALUES (?, ?)", rows)
+                n += len(rows)
+        return n
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks")
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0])
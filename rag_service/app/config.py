@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from pydantic import Field, validator
 import os
@@ -14,21 +14,80 @@ class Settings(BaseSettings):
 
     # Paths
     docs_dir: Path = Field(default=Path("/data/docs"))
+    data_dir: Path = Field(default=Path("/data/index"))  # chunk store and other local state
     # Vector DB
     qdrant_url: str = Field(default_factory=lambda: "http://qdrant:6333")
     qdrant_collection: str = Field(default="company-files")
+    qdrant_vector_datatype: str = "float32"  # float32 | float16 | uint8
+    qdrant_quantization: str | None = None  # scalar | product
+    qdrant_pq_compression: str = "x16"  # product quantization ratio: x4 .. x64
+    qdrant_quantization_always_ram: bool = True
+    qdrant_on_disk_vectors: bool = False
+    qdrant_on_disk_payload: bool = False
+    qdrant_hnsw_m: int | None = None
+    qdrant_hnsw_ef_construct: int | None = None
+    qdrant_search_ef: int | None = None
+    qdrant_rescore: bool = True  # re-rank quantized candidates with original vectors
+    qdrant_oversampling: float | None = None
     # Embeddings
-    embedding_model: str = Field(default="intfloat/multilingual-e5-base")
+    embedding_model: str = Field(default="sentence-transformers/all-MiniLM-L6-v2")
     embedding_dim: int | None = None  # auto-detected
+    embedding_backend: str = "torch"  # torch | onnx
+    embedding_quantize: bool = True  # int8 dynamic quantization (onnx backend)
+    embedding_threads: int = 0  # 0 = runtime default
+    embedding_batch_size: int = 32
+    embedding_max_seq_length: int = 256
+    embedding_onnx_dir: Path = Field(default=Path("~/.cache/rag-onnx"))
     # LLM
     llm_model: str = Field(default="llama3.1:8b")  # Ollama model tag
     llm_temperature: float = 0.2
     llm_base_url: str = Field(default_factory=lambda: "http://ollama:11434")
+    # Routing: simple lookups go to llm_small_model, the rest to the active model
+    llm_small_model: str | None = None  # unset = no routing
+    route_max_words: int = 12
+    route_min_score: float = 0.4  # best hit similarity needed to trust a small model
+    route_max_sources: int = 1  # more sources than this need a clear winner ...
+    route_min_gap: float = 0.05  # ... ahead of the runner-up by this much
+    # Extractive answers: confident retrievals are answered with highlighted sentences, no LLM
+    extractive_answers: bool = True
+    extractive_min_score: float = 0.55  # top hit similarity
+    extractive_min_coverage: float = 0.6  # share of query terms in the best sentence
+    extractive_max_sentences: int = 3
+    # Warm pool: keep the active model (and these) loaded in Ollama
+    llm_num_ctx: int = 2048  # Ollama context window; smaller is faster
+    llm_keep_alive: str = "30m"  # how long Ollama keeps a model loaded after its last use
+    llm_warm_models: List[str] = Field(default_factory=list)  # secondary models kept warm
+    llm_max_loaded_models: int = Field(default_factory=lambda: int(os.getenv("OLLAMA_MAX_LOADED_MODELS", "2")))
+    llm_warm_interval: int = 120  # seconds between keep-warm checks
+    llm_load_timeout: float = 300.0
+    # Model catalog: local search index, refreshed from ollama.com in the background
+    catalog_remote_url: str | None = "https://ollama.com/api/search"  # empty = offline
+    catalog_ttl: int = 86400  # seconds before a query's remote results are fetched again
+    installed_models_ttl: int = 30  # shared cache of Ollama's installed models
+    # Model downloads (per worker)
+    download_max_concurrent: int = 1
+    download_retries: int = 5  # reconnects after timeouts; Ollama resumes partial layers
+    download_retry_delay: float = 5.0
+    download_read_timeout: float = 120.0  # longest silence between progress lines
     # Chunking
-    chunk_size: int = 1000
+    chunker: str = "structured"  # structured | simple
+    chunk_size: int = 1000  # characters, simple chunker
     chunk_overlap: int = 100
+    chunk_max_tokens: int = 256  # model tokens, structured chunker
+    chunk_overlap_tokens: int = 32
+    chunk_tokenizer: str | None = None  # defaults to embedding_model; "approx" skips loading
+    # Small-to-big: chunks above are searched, the parent sections they sit in are
+    # sent to the LLM (structured chunker only; 0 = flat chunks, needs a re-ingest)
+    parent_max_tokens: int = 768
+    context_max_tokens: int = 1200  # budget for parent sections in one prompt
     # Indexing
     recreate_collection: bool = False
+    ingest_workers: int = Field(default_factory=lambda: min(8, os.cpu_count() or 1))  # parser threads
+    dedup: bool = True  # identical files and chunks are embedded once, with all their sources
+    dedup_max_distance: int = 3  # SimHash bits for near-duplicate chunks; 0 = exact only
+    # Runtime state shared across workers (active model, jobs, caches)
+    state_backend: str = "sqlite"  # sqlite | memory (single worker only)
+    state_path: Path | None = None  # default: <data_dir>/state.sqlite
 
     # UI
     system_prompt: str = (
@@ -36,8 +95,45 @@ class Settings(BaseSettings):
         "Use only the provided context. If unsure, say you cannot find the answer in the available resources."
     )
     top_k: int = 5
+    # Diversification of the top_k (overridable per request)
+    mmr_lambda: float = 0.7  # relevance vs novelty; 1.0 = plain similarity ranking
+    mmr_fetch_k: int = 20  # candidates fetched with their vectors for reranking
+    max_per_source: int = 0  # cap hits from one file; 0 = no cap
+    # Batch endpoints
+    batch_max_queries: int = 500
+    batch_llm_concurrency: int = 2  # concurrent Ollama generations per batch request
+    # Chat sessions: history lives in shared state, Ollama contexts in a per-worker LRU
+    session_ttl: int = 3600  # seconds since the last turn
+    session_max_turns: int = 6
+    session_max_tokens: int = 1024  # history budget; must leave room in llm_num_ctx
+    session_cache_mb: int = 64  # Ollama context token arrays kept per worker
+    session_rewrite: bool = True  # fold the previous question into follow-up searches
+    # Streaming
+    sse_ping_seconds: int = 15  # heartbeat comments keep proxies from closing idle streams
+    sse_send_timeout: float = 30.0  # drop clients that stop reading
+    stream_buffer_tokens: int = 32  # tokens read ahead of the client before pausing Ollama
 
-    @validator("docs_dir", pre=True)
+    # Rate limits per client (API key header, else IP), shared across workers; per_minute 0 = unlimited
+    rate_limit_enabled: bool = True
+    rate_limits: Dict[str, Dict[str, float]] = Field(
+        default_factory=lambda: {
+            "retrieval": {"per_minute": 120, "burst": 30},
+            "generation": {"per_minute": 20, "burst": 5},
+            "ingest": {"per_minute": 2, "burst": 1},
+        }
+    )
+    rate_limit_key_header: str = "X-API-Key"
+    rate_limit_trust_forwarded: bool = False  # key by X-Forwarded-For behind a reverse proxy
+    cors_origins: List[str] = Field(default_factory=lambda: ["*"])
+
+    # Tenants: name -> overrides of any setting above (qdrant_collection defaults
+    # to the name, docs_dir to <docs_dir parent>/tenants/<name>). Routed by /t/<name>/... or header.
+    tenants: Dict[str, Dict[str, Any]] = Field(default_factory=dict)
+    default_tenant: str = "default"
+    tenant_header: str = "X-RAG-Tenant"
+    embedding_max_models: int = 2  # embedding models kept loaded across tenants (LRU)
+
+    @validator("docs_dir", "data_dir", "embedding_onnx_dir", pre=True)
     def _expand_docs(cls, v):
         return Path(v).expanduser()
 
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import hashlib
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+_WS = re.compile(r"\s+")
+_BIT_SHIFTS = np.arange(64, dtype=np.uint64)
+# Below this many words SimHash is too noisy; such chunks only dedupe exactly
+_MIN_SIMHASH_WORDS = 20
+
+
+def _normalize(text: str) -> str:
+    if text.startswith("passage: "):
+        text = text[len("passage: "):]
+    return _WS.sub(" ", text).strip().lower()
+
+
+def file_digest(path: Path, block: int = 1 << 20) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        while chunk := f.read(block):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha1(_normalize(text).encode("utf-8")).hexdigest()
+
+
+def simhash(text: str, shingle: int = 3) -> Optional[int]:
+    """64-bit SimHash over word shingles; None for texts too short to compare."""
+    words = _normalize(text).split()
+    if len(words) < _MIN_SIMHASH_WORDS:
+        return None
+    shingles = {" ".join(words[i:i + shingle]) for i in range(len(words) - shingle + 1)}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+    ones = ((hashes[:, None] >> _BIT_SHIFTS) & np.uint64(1)).sum(axis=0)
+    bits = np.nonzero(ones * 2 > len(hashes))[0]
+    return int(sum(1 << int(b) for b in bits))
+
+
+class SimHashIndex:
+    """Finds stored fingerprints within max_distance bits.
+
+    The 64 bits are cut into max_distance + 1 bands; two fingerprints that close
+    agree exactly on at least one band, so only same-band entries are compared.
+    """
+
+    def __init__(self, max_distance: int = 3):
+        self.max_distance = max_distance
+        n = max_distance + 1
+        width = 64 // n
+        self._bands = [(i * width, 64 if i == n - 1 else (i + 1) * width) for i in range(n)]
+        self._buckets: List[Dict[int, List[Tuple[int, int]]]] = [{} for _ in self._bands]
+
+    def _keys(self, fp: int) -> List[int]:
+        return [(fp >> lo) & ((1 << (hi - lo)) - 1) for lo, hi in self._bands]
+
+    def find(self, fp: int) -> Optional[int]:
+        for bucket, key in zip(self._buckets, self._keys(fp)):
+            for other, ref in bucket.get(key, ()):
+                if bin(fp ^ other).count("1") <= self.max_distance:
+                    return ref
+        return None
+
+    def add(self, fp: int, ref: int) -> None:
+        for bucket, key in zip(self._buckets, self._keys(fp)):
+            bucket.setdefault(key, []).append((fp, ref))
+
+
+def merge_sources(meta: dict, other: dict) -> None:
+    """Record another copy of this content on the kept point's metadata."""
+    sources = meta.setdefault("sources", [meta["source"]])
+    if other["source"] not in sources:
+        sources.append(other["source"])
+    # Filters on folder or tag should find the content through any of its copies
+    for key in ("folders", "tags"):
+        meta[key] = meta.get(key, []) + [v for v in other.get(key, []) if v not in meta.get(key, [])]
+    meta["mtime"] = max(meta.get("mtime", 0), other.get("mtime", 0))
+
+
+def dedupe_chunks(items: List[dict], max_distance: int = 3) -> Tuple[List[dict], List[int]]:
+    """Drop exact and near-duplicate chunks, folding their sources into the first copy.
+
+    Returns the kept items and the ids of the dropped ones. max_distance=0 only
+    removes exact (whitespace and case insensitive) duplicates.
+    """
+    by_digest: Dict[str, int] = {}
+    index = SimHashIndex(max_distance) if max_distance > 0 else None
+    kept: List[dict] = []
+    dropped: List[int] = []
+    for item in items:
+        digest = text_digest(item["text"])
+        ref = by_digest.get(digest)
+        fp = None
+        if ref is None and index is not None:
+            fp = simhash(item["text"])
+            if fp is not None:
+                ref = index.find(fp)
+        if ref is not None:
+            merge_sources(kept[ref]["metadata"], item["metadata"])
+            dropped.append(item["id"])
+            continue
+        by_digest[digest] = len(kept)
+        if fp is not None:
+            index.add(fp, len(kept))
+        kept.append(item)
+    return kept, dropped
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import aclosing
+from typing import Dict, Optional, Tuple
+
+import httpx
+from pydantic import BaseModel
+
+from .catalog import invalidate_installed
+from .config import Settings, settings
+from .llm import OllamaClient, ollama
+from .state import shared_state
+
+
+class ModelDownloadStatus(BaseModel):
+    model_name: str
+    status: str  # queued, downloading, completed, error, cancelled
+    progress: Optional[str] = None
+    error: Optional[str] = None
+    completed: int = 0  # bytes, summed over all layers
+    total: int = 0
+    percent: Optional[float] = None
+    attempts: int = 0
+    updated_at: float = 0.0
+    cancel_requested: bool = False
+
+
+ACTIVE = {"queued", "downloading"}
+# Download statuses live in the shared state so every worker sees them
+_PREFIX = "download:"
+
+
+def load_status(model_name: str) -> Optional[ModelDownloadStatus]:
+    value = shared_state.get(_PREFIX + model_name)
+    return None if value is None else ModelDownloadStatus(**value)
+
+
+def load_statuses() -> Dict[str, ModelDownloadStatus]:
+    return {key[len(_PREFIX):]: ModelDownloadStatus(**value) for key, value in shared_state.items(_PREFIX).items()}
+
+
+class DownloadManager:
+    """Runs Ollama pulls in this worker: progress in shared state, bounded concurrency, retries."""
+
+    def __init__(self, client: OllamaClient = ollama, cfg: Settings = settings):
+        self.client = client
+        self.cfg = cfg
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _stale(self, status: ModelDownloadStatus) -> bool:
+        # Owner worker died: no progress save for longer than a pull may stay silent
+        return time.time() - status.updated_at > self.cfg.download_read_timeout * 2
+
+    def _save(self, status: ModelDownloadStatus) -> bool:
+        """Store progress; returns True if someone asked to cancel this download."""
+        status.updated_at = time.time()
+
+        def merge(current):
+            requested = bool(current and current.get("cancel_requested")) and status.status in ACTIVE
+            return {**status.model_dump(), "cancel_requested": requested}
+
+        return shared_state.update(_PREFIX + status.model_name, merge)["cancel_requested"]
+
+    def start(self, model_name: str) -> Tuple[ModelDownloadStatus, bool]:
+        """Queue a pull unless one is already active; returns (status, started)."""
+        new = ModelDownloadStatus(
+            model_name=model_name, status="queued", progress="Waiting for a download slot...", updated_at=time.time()
+        )
+
+        def claim(current):
+            if current and current.get("status") in ACTIVE and not self._stale(ModelDownloadStatus(**current)):
+                return current
+            return new.model_dump()
+
+        status = ModelDownloadStatus(**shared_state.update(_PREFIX + model_name, claim))
+        if status.updated_at != new.updated_at:
+            return status, False
+        self._tasks[model_name] = asyncio.create_task(self._run(status))
+        return status, True
+
+    async def cancel(self, model_name: str) -> Optional[ModelDownloadStatus]:
+        task = self._tasks.get(model_name)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            return load_status(model_name)
+
+        # Running in another worker: flag it, the owner stops at its next progress update
+        def request(current):
+            if current and current.get("status") in ACTIVE:
+                return {**current, "cancel_requested": True}
+            return current
+
+        value = shared_state.update(_PREFIX + model_name, request)
+        return None if value is None else ModelDownloadStatus(**value)
+
+    async def _acquire_slot(self, status: ModelDownloadStatus) -> None:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(max(1, self.cfg.download_max_concurrent))
+        while True:
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=30.0)
+                return
+            except asyncio.TimeoutError:
+                # Still queued; refresh so other workers don't take it for abandoned
+                if self._save(status):
+                    raise asyncio.CancelledError
+
+    async def _run(self, status: ModelDownloadStatus) -> None:
+        try:
+            await self._acquire_slot(status)
+            try:
+                await self._pull_with_retries(status)
+            finally:
+                self._slots.release()
+        except asyncio.CancelledError:
+            status.status = "cancelled"
+            status.progress = "Download cancelled"
+            self._save(status)
+        finally:
+            self._tasks.pop(status.model_name, None)
+
+    async def _pull_with_retries(self, status: ModelDownloadStatus) -> None:
+        delay = self.cfg.download_retry_delay
+        while True:
+            status.attempts += 1
+            status.status = "downloading"
+            status.progress = "Connecting to Ollama..."
+            if self._save(status):
+                raise asyncio.CancelledError
+            try:
+                await self._pull(status)
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                if status.attempts > self.cfg.download_retries:
+                    self._fail(status, f"{type(e).__name__} after {status.attempts} attempts")
+                    return
+                # Ollama keeps the partial layers; the next pull resumes from them
+                status.progress = f"Connection lost ({type(e).__name__}), resuming in {delay:.0f}s"
+                if self._save(status):
+                    raise asyncio.CancelledError
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60.0)
+                continue
+            except Exception as e:
+                self._fail(status, str(e))
+                return
+            invalidate_installed()
+            status.status = "completed"
+            status.progress = "Download completed successfully"
+            if status.total:
+                status.completed, status.percent = status.total, 100.0
+            self._save(status)
+            return
+
+    def _fail(self, status: ModelDownloadStatus, error: str) -> None:
+        status.status = "error"
+        status.error = error
+        status.progress = f"Download failed: {error}"
+        self._save(status)
+
+    async def _pull(self, status: ModelDownloadStatus) -> None:
+        layers: Dict[str, Tuple[int, int]] = {}
+        last_save = 0.0
+        pull = self.client.pull(status.model_name, read_timeout=self.cfg.download_read_timeout)
+        # aclosing: a cancel closes the pull request right away
+        async with aclosing(pull) as events:
+            async for event in events:
+                digest = event.get("digest")
+                if digest and event.get("total"):
+                    layers[digest] = (int(event.get("completed") or 0), int(event["total"]))
+                    status.completed = sum(done for done, _ in layers.values())
+                    status.total = sum(total for _, total in layers.values())
+                    status.percent = round(100.0 * status.completed / status.total, 1)
+                label = event.get("status", "")
+                status.progress = f"{label} {status.percent:.1f}%" if digest and status.percent is not None else label
+                now = time.monotonic()
+                # Progress lines arrive many times a second; persist a few of them
+                if now - last_save >= 0.5:
+                    last_save = now
+                    if self._save(status):
+                        raise asyncio.CancelledError
+
+
+downloads = DownloadManager()
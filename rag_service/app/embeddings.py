@@ -1,52 +1,289 @@
 from __future__ import annotations
 
-import random
-from typing import List
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
 
 from .config import settings
 
 
+class EmbeddingBackend:
+    """Encodes texts into L2-normalized float32 vectors."""
+
+    name = "base"
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    @property
+    def dim(self) -> int:
+        raise NotImplementedError
+
+
+class TorchBackend(EmbeddingBackend):
+    """sentence-transformers on PyTorch, fp32."""
+
+    name = "torch"
+
+    def __init__(self, model_name: str, batch_size: int = 32, threads: int = 0):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.model.max_seq_length = settings.embedding_max_seq_length
+        self.batch_size = batch_size
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+        ).astype(np.float32, copy=False)
+
+    @property
+    def dim(self) -> int:
+        return int(self.model.get_sentence_embedding_dimension())
+
+
+class OnnxBackend(EmbeddingBackend):
+    """ONNX Runtime export of the transformer with mean pooling, optionally int8 quantized.
+
+    The export is cached per model under settings.embedding_onnx_dir so it only
+    happens on first use.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_name: str, batch_size: int = 32, threads: int = 0, quantize: bool = True):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        path = self._ensure_exported(model_name, quantize)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(path), opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.batch_size = batch_size
+        self.quantized = quantize
+        self._dim = int(self.session.get_outputs()[0].shape[-1])
+
+    def _ensure_exported(self, model_name: str, quantize: bool) -> Path:
+        out_dir = settings.embedding_onnx_dir / model_name.replace("/", "__")
+        fp32 = out_dir / "model.onnx"
+        int8 = out_dir / "model.int8.onnx"
+        if not fp32.exists():
+            import torch
+            from transformers import AutoModel
+
+            print(f"Exporting {model_name} to ONNX at {fp32}")
+            out_dir.mkdir(parents=True, exist_ok=True)
+            model = AutoModel.from_pretrained(model_name).eval()
+            enc = self.tokenizer(["export sample"], return_tensors="pt")
+            names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in enc]
+            with torch.no_grad():
+                torch.onnx.export(
+                    model,
+                    tuple(enc[n] for n in names),
+                    str(fp32),
+                    input_names=names,
+                    output_names=["last_hidden_state"],
+                    dynamic_axes={n: {0: "batch", 1: "seq"} for n in names + ["last_hidden_state"]},
+                    opset_version=14,
+                )
+        if not quantize:
+            return fp32
+        if not int8.exists():
+            try:
+                import onnx  # noqa: F401
+            except ImportError as e:
+                raise ImportError("int8 quantization needs the onnx package; install it or set embedding_quantize: false") from e
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            print(f"Quantizing {fp32.name} to int8")
+            quantize_dynamic(str(fp32), str(int8), weight_type=QuantType.QInt8)
+        return int8
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        out = np.empty((len(texts), self._dim), dtype=np.float32)
+        # Batch texts of similar length together to minimize padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            enc = self.tokenizer(
+                [texts[i] for i in idx],
+                padding=True,
+                truncation=True,
+                max_length=settings.embedding_max_seq_length,
+                return_tensors="np",
+            )
+            feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            out[idx] = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return out
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+
+class HashingBackend(EmbeddingBackend):
+    """Deterministic feature hashing of character n-grams; no model download.
+
+    Each n-gram is hashed with a seeded polynomial rolling hash plus a splitmix64
+    finalizer, which picks both its bucket and its sign. Counts are log-scaled
+    and the vector L2-normalized, so cosine similarity tracks n-gram overlap.
+    """
+
+    name = "hash"
+    _PREFIX_RE = re.compile(r"^(?:query|passage):\s*")
+
+    def __init__(self, dim: int = 384, ngram_range: tuple[int, int] = (3, 5), seed: int = 0):
+        self._dim = dim
+        self.ngram_range = ngram_range
+        rng = np.random.default_rng(seed)
+        max_n = ngram_range[1]
+        # Odd 64-bit multipliers per position; uint64 arithmetic wraps mod 2**64
+        self._weights = rng.integers(1, 2**63, size=max_n, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+    @staticmethod
+    def _mix(h: np.ndarray) -> np.ndarray:
+        h = h ^ (h >> np.uint64(30))
+        h = h * np.uint64(0xBF58476D1CE4E5B9)
+        h = h ^ (h >> np.uint64(27))
+        h = h * np.uint64(0x94D049BB133111EB)
+        return h ^ (h >> np.uint64(31))
+
+    def _encode_one(self, text: str) -> np.ndarray:
+        text = " " + " ".join(self._PREFIX_RE.sub("", text).lower().split()) + " "
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        vec = np.zeros(self._dim, dtype=np.float64)
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            if len(codes) < n:
+                break
+            windows = np.lib.stride_tricks.sliding_window_view(codes, n)
+            h = self._mix((windows * self._weights[:n]).sum(axis=1, dtype=np.uint64) + np.uint64(n))
+            sign = (h >> np.uint64(63)).astype(np.float64) * 2.0 - 1.0
+            vec += np.bincount((h % np.uint64(self._dim)).astype(np.intp), weights=sign, minlength=self._dim)
+        vec = np.sign(vec) * np.log1p(np.abs(vec))
+        norm = np.linalg.norm(vec)
+        return (vec / norm if norm > 0 else vec).astype(np.float32)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self._dim), dtype=np.float32)
+        return np.stack([self._encode_one(t) for t in texts])
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+
+def load_backend(name: str, model_name: str) -> EmbeddingBackend:
+    if name == "hash":
+        return HashingBackend(settings.embedding_dim or 384)
+    if name == "onnx":
+        return OnnxBackend(
+            model_name,
+            batch_size=settings.embedding_batch_size,
+            threads=settings.embedding_threads,
+            quantize=settings.embedding_quantize,
+        )
+    return TorchBackend(model_name, batch_size=settings.embedding_batch_size, threads=settings.embedding_threads)
+
+
 class EmbeddingModel:
-    def __init__(self, model_name: str | None = None):
+    def __init__(self, model_name: str | None = None, backend: str | None = None):
         self.model_name = model_name or settings.embedding_model
+        self.backend: EmbeddingBackend = HashingBackend(settings.embedding_dim or 384)
         print(f"EmbeddingModel initialized with {self.model_name}")
-        
-        # Try to use a lighter embedding model if available
-        try:
-            from sentence_transformers import SentenceTransformer
-            # Use a smaller, faster model
-            self.model = SentenceTransformer('all-MiniLM-L6-v2')  # 384 dimensions, faster
-            self._use_real_embeddings = True
-            print("Using real sentence-transformers embeddings (all-MiniLM-L6-v2)")
-        except Exception as e:
-            print(f"Failed to load sentence-transformers: {e}")
-            print("Using dummy embeddings for testing")
-            self.model = None
-            self._use_real_embeddings = False
 
-    def embed(self, texts: List[str]) -> List[List[float]]:
-        if self._use_real_embeddings and self.model:
+        configured = backend or settings.embedding_backend
+        for name in dict.fromkeys([configured, "torch"]):
             try:
-                return self.model.encode(texts).tolist()
+                self.backend = load_backend(name, self.model_name)
+                break
             except Exception as e:
-                print(f"Error encoding texts: {e}, falling back to dummy")
-        
-        # Dummy embeddings fallback
-        return [[random.random() for _ in range(384)] for _ in texts]
+                level = "ERROR" if name == configured else "Warning"
+                print(f"{level}: failed to load {name} embedding backend for {self.model_name}: {e!r}")
+        if self.backend.name != configured:
+            print(f"ERROR: {configured} embeddings unavailable for {self.model_name}, falling back to {self.backend.name}")
+        print(f"Using {self.backend.name} embeddings ({self.model_name}, dim={self.backend.dim})")
+
+    @property
+    def is_fallback(self) -> bool:
+        return isinstance(self.backend, HashingBackend)
+
+    def match_dim(self, dim: int) -> None:
+        """Align the hashing fallback with an existing collection's vector size."""
+        if self.is_fallback and self.backend.dim != dim:
+            self.backend = HashingBackend(dim)
+        elif self.backend.dim != dim:
+            print(f"Warning: collection dim {dim} != embedding dim {self.backend.dim} for {self.model_name}")
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        # Hashing only stands in for a backend that failed to load; vectors from it
+        # next to real ones in a collection would be garbage, so encode errors propagate
+        return self.backend.encode(texts).tolist()
 
     def embed_query(self, text: str) -> List[float]:
-        if self._use_real_embeddings and self.model:
-            try:
-                return self.model.encode([text])[0].tolist()
-            except Exception as e:
-                print(f"Error encoding query: {e}, falling back to dummy")
-        
-        # Dummy query embedding fallback
-        return [random.random() for _ in range(384)]
+        return self.embed([text])[0]
 
     @property
     def dim(self) -> int:
-        return 384
+        return self.backend.dim
+
+
+class EmbeddingPool:
+    """Embedding models shared by tenants, loaded lazily and evicted LRU."""
+
+    def __init__(self, max_models: int):
+        self.max_models = max(1, max_models)
+        self._models: "OrderedDict[str, EmbeddingModel]" = OrderedDict()
+        self._lock = threading.Lock()  # LRU bookkeeping only
+        self._loading: Dict[str, threading.Lock] = {}
+
+    def _cached(self, model_name: str) -> Optional[EmbeddingModel]:
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is not None:
+                self._models.move_to_end(model_name)
+            return model
+
+    def get(self, model_name: str) -> EmbeddingModel:
+        model = self._cached(model_name)
+        if model is not None:
+            return model
+        # Loading takes seconds; serialise it per model so other tenants' models stay reachable
+        with self._lock:
+            loading = self._loading.setdefault(model_name, threading.Lock())
+        with loading:
+            model = self._cached(model_name)
+            if model is not None:
+                return model
+            model = EmbeddingModel(model_name)
+            with self._lock:
+                self._models[model_name] = model
+                self._loading.pop(model_name, None)
+                while len(self._models) > self.max_models:
+                    evicted, _ = self._models.popitem(last=False)
+                    print(f"Evicted embedding model {evicted}")
+            return model
+
+    def loaded(self) -> List[str]:
+        with self._lock:
+            return list(self._models)
 
 
-embeddings = EmbeddingModel()
+embedding_pool = EmbeddingPool(settings.embedding_max_models)
@@ -0,0 +1,234 @@
+"""Retrieval evaluation: recall@k, MRR and nDCG@k with per-query latency.
+
+The dataset is JSONL, one question per line:
+
+    {"question": "How many vacation days?", "expected_source": "hr/leave.md"}
+    {"question": "...", "expected_sources": ["a.pdf", "b.md"], "expected_chunks": [3]}
+
+Sources may be relative to the tenant's docs_dir. With expected_chunks only those
+chunk indexes of the expected sources count as relevant. Every run is appended to
+<data_dir>/eval/results.jsonl together with the settings that affect retrieval.
+
+    python -m app.evaluation run qa.jsonl --k 5 --label onnx-int8
+    python -m app.evaluation compare
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from .config import settings
+from .retrieval import Hit, retrieve
+from .tenants import Tenant, tenants
+
+
+# Settings that change what retrieval returns or how fast
+CONFIG_KEYS = (
+    "chunker",
+    "chunk_max_tokens",
+    "chunk_overlap_tokens",
+    "chunk_size",
+    "chunk_overlap",
+    "embedding_model",
+    "embedding_backend",
+    "embedding_quantize",
+    "qdrant_collection",
+    "qdrant_vector_datatype",
+    "qdrant_quantization",
+    "qdrant_on_disk_vectors",
+    "qdrant_hnsw_m",
+    "qdrant_hnsw_ef_construct",
+    "qdrant_search_ef",
+    "qdrant_rescore",
+    "mmr_lambda",
+    "mmr_fetch_k",
+    "max_per_source",
+)
+
+
+def _first(row: dict, *keys: str):
+    for key in keys:
+        if row.get(key) not in (None, "", []):
+            return row[key]
+    return None
+
+
+def load_dataset(path: Path) -> List[dict]:
+    items: List[dict] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            question = _first(row, "question", "query", "title")
+            sources = _first(row, "expected_sources", "expected_source", "sources", "source")
+            if not question or not sources:
+                continue
+            chunks = _first(row, "expected_chunks", "expected_chunk", "chunks", "chunk")
+            items.append(
+                {
+                    "question": str(question),
+                    "sources": [sources] if isinstance(sources, str) else list(sources),
+                    "chunks": None if chunks is None else {int(c) for c in ([chunks] if isinstance(chunks, int) else chunks)},
+                }
+            )
+    return items
+
+
+def _matches(source: Optional[str], expected: str, docs_dir: Path) -> bool:
+    if not source:
+        return False
+    expected = expected.strip("/")
+    return source == expected or source.endswith("/" + expected) or source == str(docs_dir / expected)
+
+
+def _relevant_keys(hits: List[Hit], item: dict, docs_dir: Path) -> List[Optional[Tuple[str, int]]]:
+    """For each hit, the relevant item it found (expected source, chunk) or None."""
+    keys: List[Optional[Tuple[str, int]]] = []
+    for hit in hits:
+        key = None
+        for expected in item["sources"]:
+            # Duplicates merged at ingest keep the other copies' paths in "sources"
+            if any(_matches(src, expected, docs_dir) for src in hit.payload.get("sources") or [hit.source]):
+                chunk = int(hit.payload.get("chunk", -1))
+                if item["chunks"] is None:
+                    key = (expected, -1)
+                elif chunk in item["chunks"]:
+                    key = (expected, chunk)
+                break
+        keys.append(key)
+    return keys
+
+
+def score(keys: List[Optional[Tuple[str, int]]], n_relevant: int, k: int) -> Dict[str, float]:
+    seen: Set[Tuple[str, int]] = set()
+    gains: List[int] = []
+    first_rank = 0
+    for rank, key in enumerate(keys[:k], 1):
+        # Duplicate hits of an already found item earn nothing
+        new = key is not None and key not in seen
+        gains.append(1 if new else 0)
+        if new:
+            seen.add(key)
+            first_rank = first_rank or rank
+    dcg = sum(g / math.log2(r + 1) for r, g in enumerate(gains, 1))
+    idcg = sum(1 / math.log2(r + 1) for r in range(1, min(n_relevant, k) + 1))
+    return {
+        "recall": len(seen) / n_relevant if n_relevant else 0.0,
+        "mrr": 1.0 / first_rank if first_rank else 0.0,
+        "ndcg": dcg / idcg if idcg else 0.0,
+    }
+
+
+def evaluate(tenant: Tenant, dataset: List[dict], k: int) -> dict:
+    docs_dir = tenant.settings.docs_dir
+    per_query: List[dict] = []
+    latencies: List[float] = []
+    # Warm the model and connection so the first query's latency is representative
+    retrieve(tenant, "warm-up", top_k=k)
+    for item in dataset:
+        t0 = time.perf_counter()
+        hits = retrieve(tenant, item["question"], top_k=k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        n_relevant = len(item["sources"]) * (len(item["chunks"]) if item["chunks"] is not None else 1)
+        metrics = score(_relevant_keys(hits, item, docs_dir), n_relevant, k)
+        per_query.append({"question": item["question"], "latency_ms": round(latencies[-1], 2), **metrics})
+
+    def mean(key: str) -> float:
+        return round(statistics.fmean(q[key] for q in per_query), 4) if per_query else 0.0
+
+    lat = sorted(latencies)
+    return {
+        f"recall@{k}": mean("recall"),
+        "mrr": mean("mrr"),
+        f"ndcg@{k}": mean("ndcg"),
+        "latency_ms": {
+            "mean": round(statistics.fmean(lat), 2) if lat else 0.0,
+            "p50": round(lat[len(lat) // 2], 2) if lat else 0.0,
+            "p95": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))], 2) if lat else 0.0,
+        },
+        "queries": per_query,
+    }
+
+
+def results_path() -> Path:
+    return settings.data_dir / "eval" / "results.jsonl"
+
+
+def save_result(result: dict) -> Path:
+    path = results_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result) + "\n")
+    return path
+
+
+def run(dataset_path: Path, k: int, tenant_name: Optional[str], label: Optional[str]) -> dict:
+    tenant = tenants.get(tenant_name)
+    dataset = load_dataset(dataset_path)
+    if not dataset:
+        raise SystemExit(f"No usable (question, expected source) rows in {dataset_path}")
+    metrics = evaluate(tenant, dataset, k)
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "label": label,
+        "dataset": str(dataset_path),
+        "tenant": tenant.name,
+        "k": k,
+        "config": {key: getattr(tenant.settings, key) for key in CONFIG_KEYS},
+        **metrics,
+    }
+    save_result(result)
+    return result
+
+
+def compare() -> None:
+    path = results_path()
+    if not path.exists():
+        print(f"No results in {path}")
+        return
+    print(f"{'timestamp':<20} {'label':<16} {'k':>3} {'recall':>7} {'mrr':>6} {'ndcg':>6} {'p50 ms':>7} {'p95 ms':>7}  config")
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            r = json.loads(line)
+            k = r["k"]
+            cfg = r["config"]
+            print(
+                f"{r['timestamp']:<20} {str(r.get('label') or '-'):<16} {k:>3} "
+                f"{r[f'recall@{k}']:>7.3f} {r['mrr']:>6.3f} {r[f'ndcg@{k}']:>6.3f} "
+                f"{r['latency_ms']['p50']:>7.1f} {r['latency_ms']['p95']:>7.1f}  "
+                f"{cfg['embedding_model']}/{cfg['embedding_backend']} {cfg['chunker']}:{cfg['chunk_max_tokens']} "
+                f"q={cfg['qdrant_quantization'] or 'none'}"
+            )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    run_p = sub.add_parser("run", help="evaluate a dataset and save the result")
+    run_p.add_argument("dataset", type=Path)
+    run_p.add_argument("--k", type=int, default=settings.top_k)
+    run_p.add_argument("--tenant", default=None)
+    run_p.add_argument("--label", default=None, help="name for this configuration")
+    sub.add_parser("compare", help="list saved results")
+    args = ap.parse_args()
+
+    if args.cmd == "compare":
+        compare()
+        return
+    result = run(args.dataset, args.k, args.tenant, args.label)
+    k = result["k"]
+    print(
+        f"recall@{k}={result[f'recall@{k}']:.3f} mrr={result['mrr']:.3f} ndcg@{k}={result[f'ndcg@{k}']:.3f} "
+        f"latency p50={result['latency_ms']['p50']}ms p95={result['latency_ms']['p95']}ms "
+        f"({len(result['queries'])} queries) -> {results_path()}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import re
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional, Tuple
+
+from .config import Settings
+from .retrieval import Hit
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+_WORD = re.compile(r"\w+")
+_SPACE = re.compile(r"\s+")
+_PASSAGE_PREFIX = "passage: "  # E5 prefix the loaders store in front of every chunk
+_MAX_SENTENCE_CHARS = 500  # longer "sentences" are unpunctuated runs, not answers
+STOPWORDS = frozenset(
+    "a an and are as at be by can could do does did for from has have how i if in is it its me my "
+    "of on or our should so than that the their them there these they this to was we were what when "
+    "where which who whom why will with would you your".split()
+)
+
+
+@dataclass
+class Extract:
+    text: str
+    source: Optional[str]
+    score: float  # share of the query terms found in the sentence
+    hit_score: float
+    page: Optional[int] = None
+    spans: List[Tuple[int, int]] = field(default_factory=list)  # matched words, offsets into text
+
+
+def _norm(word: str) -> str:
+    # Crude suffix folding so "policies" matches "policy" and "approved" matches "approve"
+    word = word.lower()
+    for suffix in ("ies", "ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)]
+    return word
+
+
+def query_terms(query: str) -> set:
+    return {_norm(w) for w in _WORD.findall(query) if w.lower() not in STOPWORDS and len(w) > 1}
+
+
+def sentences(text: str) -> List[str]:
+    if text.startswith(_PASSAGE_PREFIX):
+        text = text[len(_PASSAGE_PREFIX):]
+    out = []
+    for part in _SENTENCE_END.split(text):
+        part = _SPACE.sub(" ", part).strip()
+        if part and len(part) <= _MAX_SENTENCE_CHARS:
+            out.append(part)
+    return out
+
+
+def extract(query: str, hits: List[Hit], max_sentences: int = 3, max_hits: int = 3) -> List[Extract]:
+    """Sentences of the top hits that cover the most query terms, best first.
+
+    Sentences come from the matched chunk, not its expanded parent section, so
+    the cited page is the one they are on.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return []
+    found: List[Extract] = []
+    seen = set()
+    for hit in hits[:max_hits]:
+        for sentence in sentences(hit.chunk or hit.text or ""):
+            if sentence in seen:
+                continue
+            seen.add(sentence)
+            spans, matched = [], set()
+            for m in _WORD.finditer(sentence):
+                term = _norm(m.group())
+                if term in terms:
+                    spans.append(m.span())
+                    matched.add(term)
+            if matched:
+                found.append(
+                    Extract(
+                        sentence, hit.source, round(len(matched) / len(terms), 3), hit.score, hit.payload.get("page"), spans
+                    )
+                )
+    found.sort(key=lambda e: (e.score, e.hit_score), reverse=True)
+    return found[:max_sentences]
+
+
+def confident(hits: List[Hit], extracts: List[Extract], cfg: Settings) -> bool:
+    return bool(hits and extracts) and (
+        hits[0].score >= cfg.extractive_min_score and extracts[0].score >= cfg.extractive_min_coverage
+    )
+
+
+def fast_answer(query: str, hits: List[Hit], cfg: Settings, route: Optional[str] = None) -> Optional[List[Extract]]:
+    """Extracts to answer with instead of the LLM, or None to generate.
+
+    route="extractive" forces this path, "small"/"large" skip it; otherwise it is
+    taken when enabled and retrieval is confident.
+    """
+    if route in ("small", "large") or (route is None and not cfg.extractive_answers):
+        return None
+    extracts = extract(query, hits, cfg.extractive_max_sentences)
+    if route == "extractive" or confident(hits, extracts, cfg):
+        return extracts
+    return None
+
+
+def highlight(e: Extract, start: str = "**", end: str = "**") -> str:
+    out, pos = [], 0
+    for a, b in e.spans:
+        out += [e.text[pos:a], start, e.text[a:b], end]
+        pos = b
+    out.append(e.text[pos:])
+    return "".join(out)
+
+
+def answer_text(extracts: List[Extract]) -> str:
+    if not extracts:
+        return "No matching passage found in the available resources."
+    return "\n".join(f"{highlight(e)} ({cite(e)})" for e in extracts)
+
+
+def cite(e: Extract) -> str:
+    source = e.source or "unknown source"
+    return f"{source}, p. {e.page}" if e.page else source
+
+
+def to_dicts(extracts: List[Extract]) -> List[dict]:
+    return [asdict(e) for e in extracts]
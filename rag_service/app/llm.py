@@ -1,11 +1,13 @@
 from __future__ import annotations
 
 import json
-from typing import AsyncGenerator, Dict, Optional
+from typing import AsyncGenerator, Callable, Dict, List, Optional
 
 import httpx
 
+from .catalog import installed_names, invalidate_installed
 from .config import settings
+from .warmpool import warm_pool
 
 
 class OllamaClient:
@@ -13,24 +15,35 @@ class OllamaClient:
         self.base_url = (base_url or settings.llm_base_url).rstrip("/")
 
     async def ensure_model(self, model: str) -> None:
-        # Try tags; if not present, trigger a pull (idempotent)
-        try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                r = await client.get(f"{self.base_url}/api/tags")
-                r.raise_for_status()
-                tags = r.json().get("models", [])
-                names = {m.get("name") for m in tags}
-                if model in names:
-                    return
-        except Exception:
-            pass
+        # Installed models are cached in shared state; if not present, trigger a pull (idempotent)
+        if model in await installed_names():
+            return
         # Pull model
-        async with httpx.AsyncClient(timeout=httpx.Timeout(600.0)) as client:
+        async for _ in self.pull(model):
+            pass
+        invalidate_installed()
+
+    async def pull(self, model: str, read_timeout: float = 600.0) -> AsyncGenerator[Dict, None]:
+        """Stream /api/pull progress lines: {"status", "digest", "total", "completed"}.
+
+        Ollama keeps partially downloaded layers, so pulling again after a failure
+        resumes where the previous attempt stopped. read_timeout bounds the silence
+        between two progress lines, not the whole download.
+        """
+        timeout = httpx.Timeout(read_timeout, connect=10.0)
+        async with httpx.AsyncClient(timeout=timeout) as client:
             async with client.stream("POST", f"{self.base_url}/api/pull", json={"name": model}) as r:
                 r.raise_for_status()
-                async for _ in r.aiter_lines():
-                    # Ignore progress lines
-                    pass
+                async for line in r.aiter_lines():
+                    if not line:
+                        continue
+                    try:
+                        obj = json.loads(line)
+                    except ValueError:
+                        continue
+                    if obj.get("error"):
+                        raise RuntimeError(obj["error"])
+                    yield obj
 
     async def generate(
         self,
@@ -40,6 +53,8 @@ class OllamaClient:
         system: Optional[str] = None,
         max_tokens: int = 150,
         timeout: float = 45.0,
+        context: Optional[List[int]] = None,
+        on_done: Optional[Callable[[Dict], None]] = None,
     ) -> str:
         await self.ensure_model(model)
         url = f"{self.base_url}/api/generate"
@@ -49,17 +64,24 @@ class OllamaClient:
             "options": {
                 "temperature": temperature,
                 "num_predict": max_tokens,
-                "num_ctx": 2048,  # Smaller context for speed
+                "num_ctx": settings.llm_num_ctx,
             },
             "stream": False,
+            "keep_alive": settings.llm_keep_alive,
         }
         if system:
             payload["system"] = system
+        if context:
+            # Token state of the previous turn; Ollama skips prefill for it
+            payload["context"] = context
+        warm_pool.touch(model)
         async with httpx.AsyncClient(timeout=httpx.Timeout(timeout)) as client:
             try:
                 r = await client.post(url, json=payload)
                 r.raise_for_status()
                 data = r.json()
+                if on_done:
+                    on_done(data)
                 return data.get("response", "")
             except httpx.TimeoutException:
                 return "Response timed out. The model may be overloaded. Please try again."
@@ -74,6 +96,8 @@ class OllamaClient:
         system: Optional[str] = None,
         max_tokens: int = 150,
         timeout: float = 30.0,
+        context: Optional[List[int]] = None,
+        on_done: Optional[Callable[[Dict], None]] = None,
     ) -> AsyncGenerator[str, None]:
         await self.ensure_model(model)
         url = f"{self.base_url}/api/generate"
@@ -83,12 +107,17 @@ class OllamaClient:
             "options": {
                 "temperature": temperature,
                 "num_predict": max_tokens,
-                "num_ctx": 2048,  # Smaller context for speed
+                "num_ctx": settings.llm_num_ctx,
             },
             "stream": True,
+            "keep_alive": settings.llm_keep_alive,
         }
         if system:
             payload["system"] = system
+        if context:
+            # Token state of the previous turn; Ollama skips prefill for it
+            payload["context"] = context
+        warm_pool.touch(model)
         
         try:
             async with httpx.AsyncClient(timeout=httpx.Timeout(timeout)) as client:
@@ -102,6 +131,8 @@ class OllamaClient:
                             token = obj.get("response")
                             if token:
                                 yield token
+                            if obj.get("done") and on_done:
+                                on_done(obj)
                         except Exception:
                             continue
         except httpx.TimeoutException:
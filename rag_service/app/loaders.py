@@ -1,15 +1,30 @@
 from __future__ import annotations
 
+import bisect
 import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Iterable, List
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
-from pypdf import PdfReader
+import yaml
 
-from .config import settings
+from .chunking import chunk_text, token_counter
+from .config import Settings, settings
+from .dedup import file_digest, merge_sources
+from . import parsers
+from .parsers import ParseStats, Section, parser_for, record_stats, timed
 
 
-SUPPORTED_EXTS = {".txt", ".md", ".pdf"}
+# Extensions with a registered parser; files without one are sniffed by content
+SUPPORTED_EXTS = set(parsers.extensions())
+# Parent sections share the chunk store with child points; keep their ids apart
+PARENT_ID_OFFSET = 1 << 40
+# Sections are chunked in blocks of about this size; chunks never span two blocks
+_BLOCK_CHARS = 64_000
+
+# Shared by the ingests of all tenants, so parallel runs don't multiply threads
+ingest_pool = ThreadPoolExecutor(max_workers=settings.ingest_workers, thread_name_prefix="ingest")
 
 
 def file_id(path: Path) -> int:
@@ -17,9 +32,10 @@ def file_id(path: Path) -> int:
     return int(hashlib.sha1(str(path).encode("utf-8")).hexdigest()[:8], 16)
 
 
-def iter_files(root: Path) -> Iterable[Path]:
+def iter_files(root: Path, exclude: Iterable[Path] = ()) -> Iterable[Path]:
+    exclude = tuple(exclude)
     for p in root.rglob("*"):
-        if p.is_file() and p.suffix.lower() in SUPPORTED_EXTS:
+        if p.is_file() and parser_for(p) is not None and not any(p.is_relative_to(x) for x in exclude):
             yield p
 
 
@@ -39,41 +55,193 @@ def simple_text_split(text: str, chunk_size: int = 1000, chunk_overlap: int = 10
     return chunks
 
 
-def load_file(path: Path) -> List[dict]:
-    suffix = path.suffix.lower()
-    if suffix == ".pdf":
-        try:
-            reader = PdfReader(str(path))
-            text = "\n".join(page.extract_text() for page in reader.pages)
-        except Exception:
-            text = f"Failed to read PDF: {path}"
-    else:
-        # Handle .txt and .md as plain text
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                text = f.read()
-        except Exception:
-            text = f"Failed to read file: {path}"
-    
-    chunks = simple_text_split(text, settings.chunk_size, settings.chunk_overlap)
-    items = []
-    for i, chunk_text in enumerate(chunks):
-        # E5 document prefix improves retrieval quality
-        prefixed = f"passage: {chunk_text}"
-        # Use deterministic integer ID based on path and chunk index
-        point_id = file_id(path) + i
-        items.append(
-            {
-                "id": point_id,
-                "text": prefixed,
-                "metadata": {"source": str(path), "chunk": i},
-            }
-        )
+def split_front_matter(text: str) -> Tuple[dict, str]:
+    """Separate a leading YAML front-matter block (--- ... ---) from the body."""
+    if not text.startswith("---"):
+        return {}, text
+    end = text.find("\n---", 3)
+    if end == -1:
+        return {}, text
+    try:
+        meta = yaml.safe_load(text[3:end]) or {}
+    except yaml.YAMLError:
+        return {}, text
+    if not isinstance(meta, dict):
+        return {}, text
+    body_start = text.find("\n", end + 4)
+    return meta, text[body_start + 1:] if body_start != -1 else ""
+
+
+def file_metadata(path: Path, root: Optional[Path], front_matter: dict, file_type: Optional[str] = None) -> dict:
+    """Structured, filterable metadata shared by all chunks of a file."""
+    try:
+        rel = path.parent.relative_to(root).as_posix() if root else ""
+    except ValueError:
+        rel = ""
+    rel = "" if rel == "." else rel
+    parts = rel.split("/") if rel else []
+    tags = front_matter.get("tags") or []
+    if isinstance(tags, str):
+        tags = [t.strip() for t in tags.split(",")]
+    try:
+        mtime = int(path.stat().st_mtime)
+    except OSError:
+        mtime = 0
+    return {
+        "source": str(path),
+        "folder": rel,
+        # Every ancestor folder, so a filter on "hr" also matches "hr/policies"
+        "folders": ["/".join(parts[: i + 1]) for i in range(len(parts))],
+        "file_type": file_type or path.suffix.lower().lstrip("."),
+        "mtime": mtime,
+        "tags": [str(t).strip().lower() for t in tags if str(t).strip()],
+    }
+
+
+def _blocks(sections: Iterable[Section], size: int = _BLOCK_CHARS) -> Iterator[Tuple[str, List[Tuple[int, int]]]]:
+    """Join sections into blocks of about size characters, with (offset, page) of each page start."""
+    buf: List[str] = []
+    pages: List[Tuple[int, int]] = []
+    n = 0
+    for section in sections:
+        if section.page is not None:
+            pages.append((n, section.page))
+        buf.append(section.text)
+        n += len(section.text) + 2
+        if n >= size:
+            yield "\n\n".join(buf), pages
+            buf, pages, n = [], [], 0
+    if buf:
+        yield "\n\n".join(buf), pages
+
+
+class _PageLocator:
+    """Page a chunk starts on, found by searching its first words in the block.
+
+    Chunks come in document order, so each search starts where the last chunk
+    started; the chunker normalizes whitespace, hence the \\s+ between words.
+    """
+
+    def __init__(self, block: str, pages: List[Tuple[int, int]]):
+        self.block = block
+        self.offsets = [offset for offset, _ in pages]
+        self.pages = [page for _, page in pages]
+        self.pos = 0
+
+    def page(self, chunk: str) -> Optional[int]:
+        if not self.pages:
+            return None
+        words = chunk.split()[:6]
+        if words:
+            m = re.compile(r"\s+".join(map(re.escape, words))).search(self.block, self.pos)
+            if m:
+                self.pos = m.start()
+        return self.pages[max(0, bisect.bisect_right(self.offsets, self.pos) - 1)]
+
+
+def _groups(text: str, cfg: Settings) -> List[Tuple[Optional[str], List[str]]]:
+    """(parent section or None, child chunks) of a block of text."""
+    if cfg.chunker == "simple":
+        return [(None, simple_text_split(text, cfg.chunk_size, cfg.chunk_overlap))]
+    count = token_counter(cfg.chunk_tokenizer or cfg.embedding_model)
+    if cfg.parent_max_tokens > cfg.chunk_max_tokens:
+        parents = chunk_text(text, cfg.parent_max_tokens, 0, count)
+        return [(p, chunk_text(p, cfg.chunk_max_tokens, cfg.chunk_overlap_tokens, count)) for p in parents]
+    return [(None, chunk_text(text, cfg.chunk_max_tokens, cfg.chunk_overlap_tokens, count))]
+
+
+def load_file(
+    path: Path, root: Optional[Path] = None, cfg: Settings = settings, stats: Optional[ParseStats] = None
+) -> List[dict]:
+    """Chunk a file as its parser streams it; parse time and size go to stats."""
+    parser = parser_for(path)
+    if parser is None:
+        return []
+    stats = stats or ParseStats(parser.name)
+    stats.files += 1
+    try:
+        stats.bytes += path.stat().st_size
+    except OSError:
+        pass
+    sections = timed(parser.parse(path), stats)
+
+    front_matter: dict = {}
+    if parser.front_matter and path.suffix.lower() in (".md", ".markdown"):
+        first = next(sections, None)
+        if first is not None:
+            front_matter, text = split_front_matter(first.text)
+            sections = _chain(first._replace(text=text), sections)
+    file_type = path.suffix.lower().lstrip(".") or parser.name
+    meta = file_metadata(path, root, front_matter, file_type)
+
+    base_id = file_id(path)
+    items: List[dict] = []
+    i = j = 0
+    try:
+        for block, pages in _blocks(sections):
+            locate = _PageLocator(block, pages)
+            for parent, chunks in _groups(block, cfg):
+                for chunk in chunks:
+                    page = locate.page(chunk)
+                    # E5 document prefix improves retrieval quality
+                    prefixed = f"passage: {chunk}"
+                    # Use deterministic integer ID based on path and chunk index
+                    item = {"id": base_id + i, "text": prefixed, "metadata": {**meta, "chunk": i}}
+                    if page is not None:
+                        item["metadata"]["page"] = page
+                    if parent is not None:
+                        item["metadata"]["parent_id"] = PARENT_ID_OFFSET + base_id + j
+                        item["parent_text"] = parent
+                    items.append(item)
+                    i += 1
+                j += 1
+    except Exception as e:
+        # Keep what was read before the failure
+        print(f"Failed to parse {path} with {parser.name} parser: {e}")
+        if not items:
+            items = [{"id": base_id, "text": f"passage: Failed to read file: {path}", "metadata": {**meta, "chunk": 0}}]
     return items
 
 
-def load_all(root: Path) -> List[dict]:
+def _chain(first: Section, rest: Iterator[Section]) -> Iterator[Section]:
+    yield first
+    yield from rest
+
+
+def load_all(root: Path, cfg: Settings = settings, exclude: Iterable[Path] = ()) -> List[dict]:
+    """Chunks of every file under root but outside exclude, parsed in parallel on the ingest pool.
+
+    Byte-identical copies are parsed once; a copy only adds its path (and
+    folders) to the first copy's chunks.
+    """
+    paths = list(iter_files(root, exclude))
+    digests = list(ingest_pool.map(file_digest, paths)) if cfg.dedup else [None] * len(paths)
+    first_copy: Dict[str, Path] = {}
+    copies: List[Tuple[Path, str]] = []
+    unique: List[Path] = []
+    for p, digest in zip(paths, digests):
+        if digest in first_copy:
+            copies.append((p, digest))
+            continue
+        if digest:
+            first_copy[digest] = p
+        unique.append(p)
+
+    def load(p: Path) -> Tuple[List[dict], ParseStats]:
+        stats = ParseStats(parser_for(p).name)
+        return load_file(p, root, cfg, stats), stats
+
     all_chunks: List[dict] = []
-    for p in iter_files(root):
-        all_chunks.extend(load_file(p))
+    by_path: Dict[Path, List[dict]] = {}
+    totals: Dict[str, ParseStats] = {}
+    # map keeps the file order, so chunk order (and dedup choices) stay deterministic
+    for p, (items, stats) in zip(unique, ingest_pool.map(load, unique)):
+        by_path[p] = items
+        all_chunks.extend(items)
+        totals.setdefault(stats.parser, ParseStats(stats.parser)).merge(stats)
+    for p, digest in copies:
+        meta = file_metadata(p, root, {})
+        for item in by_path[first_copy[digest]]:
+            merge_sources(item["metadata"], meta)
+    record_stats(totals)
     return all_chunks
@@ -1,36 +1,71 @@
 from __future__ import annotations
 
+import asyncio
+import json
+import time
+from contextlib import aclosing, asynccontextmanager
 from pathlib import Path
-from typing import AsyncGenerator
+from typing import AsyncGenerator, List, Optional
 
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
 from sse_starlette.sse import EventSourceResponse
+from starlette.concurrency import run_in_threadpool
 from starlette.staticfiles import StaticFiles
 from starlette.templating import Jinja2Templates
 
 from .config import settings
+from .extractive import answer_text, fast_answer, to_dicts
 from .llm import ollama
 from .routers import chat as chat_router
 from .routers import ingest as ingest_router
 from .routers import status as status_router
 from .routers import models as models_router
-
-app = FastAPI(title="RAG Chatbot Service")
+from .routers import retrieve as retrieve_router
+from .routers import snapshots as snapshots_router
+from .routers.chat import choose_route, session_prompt
+from .routing import EXTRACTIVE, record_route
+from .sessions import sessions
+from .metrics import metrics
+from .ratelimit import rate_limit
+from .state import get_active_model
+from .streaming import StreamStats, relay
+from .tenants import Tenant, TenantPathMiddleware, get_tenant
+from .warmpool import warm_pool
+from .warmup import STARTED_AT, readiness, require_ready, warm_up
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Serve /health immediately; models and Qdrant warm up in the background
+    readiness.mark("live", STARTED_AT)
+    print(f"Live in {readiness.timings['live']}s, warming up in the background")
+    task = asyncio.create_task(warm_up())
+    keep_warm = asyncio.create_task(warm_pool.run())
+    yield
+    task.cancel()
+    keep_warm.cancel()
+
+
+app = FastAPI(title="RAG Chatbot Service", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
+    allow_origins=settings.cors_origins,
+    # The service uses no cookies; credentials only make sense with named origins
+    allow_credentials="*" not in settings.cors_origins,
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(TenantPathMiddleware)
 
 app.include_router(ingest_router.router)
 app.include_router(chat_router.router)
 app.include_router(status_router.router)
 app.include_router(models_router.router)
+app.include_router(retrieve_router.router)
+app.include_router(snapshots_router.router)
 
 # Static UI
 static_dir = Path(__file__).parent / "static"
@@ -49,89 +84,162 @@ async def health():
     return {"status": "ok"}
 
 
-@app.get("/chat/stream")
-async def chat_stream(q: str):
+@app.get("/ready")
+async def ready():
+    """Readiness: 503 until embedding models and vector stores are warm."""
+    return JSONResponse(readiness.report(), status_code=200 if readiness.ready else 503)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Counters summed across workers (streams, tokens generated vs delivered, ...)."""
+    return metrics.snapshot()
+
+
+def _query_filters(folder: Optional[List[str]], file_type: Optional[List[str]], tag: Optional[List[str]]):
+    from .retrieval import SearchFilters
+
+    if not (folder or file_type or tag):
+        return None
+    return SearchFilters(folder=folder, file_type=file_type, tags=tag)
+
+
+def _query_diversity(mmr_lambda: Optional[float], max_per_source: Optional[int]):
+    from .retrieval import Diversity
+
+    return Diversity(mmr_lambda=mmr_lambda, max_per_source=max_per_source)
+
+
+@app.get("/chat/stream", dependencies=[Depends(require_ready), Depends(rate_limit("generation"))])
+async def chat_stream(
+    q: str,
+    folder: Optional[List[str]] = Query(None),
+    file_type: Optional[List[str]] = Query(None),
+    tag: Optional[List[str]] = Query(None),
+    mmr_lambda: Optional[float] = Query(None, ge=0.0, le=1.0),
+    max_per_source: Optional[int] = Query(None, ge=0),
+    session_id: Optional[str] = Query(None, max_length=64),
+    route: Optional[str] = Query(None, pattern="^(extractive|small|large)$"),
+    upgrade: bool = Query(False),  # stream an LLM answer after a confident extractive one
+    tenant: Tenant = Depends(get_tenant),
+):
     # Build minimal context by performing retrieval like in POST /chat/ask
-    from .embeddings import embeddings
-    from .vectorstore import vs
+    from .retrieval import retrieve
 
-    query_text = f"query: {q}"
-    qvec = embeddings.embed_query(query_text)
-    results = vs.search(qvec, top_k=settings.top_k)
+    turn = sessions.begin(tenant.name, session_id, q, get_active_model()) if session_id else None
+    top_k = tenant.settings.top_k
     contexts = []
-    for r in results:
-        payload = r.payload or {}
-        if isinstance(payload, dict):
-            txt = payload.get("text")
-            if txt:
-                contexts.append(str(txt))
-            src = payload.get("source")
-            if src and len(contexts) < settings.top_k:
-                contexts.append(f"See: {src}")
+    # Embedding and the synchronous Qdrant client block; keep them off the event loop
+    hits = await run_in_threadpool(
+        retrieve,
+        tenant,
+        turn.search_query if turn else q,
+        filters=_query_filters(folder, file_type, tag),
+        expand=True,
+        diversity=_query_diversity(mmr_lambda, max_per_source),
+    )
+    t0 = time.perf_counter()
+    extracts = fast_answer(q, hits, tenant.settings, route)
+    extract_seconds = time.perf_counter() - t0
+    chosen = choose_route(tenant, q, hits, turn, route)
+    for hit in hits:
+        if hit.text:
+            contexts.append(hit.text)
+        if hit.source and len(contexts) < top_k:
+            contexts.append(f"See: {hit.source}")
     if not contexts:
         contexts = ["No specific context retrieved."]
 
-    system = settings.system_prompt
-    prompt = (
-        f"System: {system}\n\nContext: \n- "
-        + "\n- ".join(contexts)
-        + f"\n\nUser question: {q}\n\nAnswer:"
-    )
+    prompt = session_prompt(turn, q, contexts, tenant.settings.system_prompt, max_tokens=100)
 
     async def gen() -> AsyncGenerator[str, None]:
-        # Provide immediate fallback with document retrieval results
-        yield f"🔍 **Found relevant documents for: {q}**\n\n"
-        
-        for i, ctx in enumerate(contexts[:2], 1):
-            yield f"**Document {i}**: {ctx[:300]}...\n\n"
-        
-        yield f"📊 **Summary**: Retrieved {len(contexts)} relevant passages from your indexed documents.\n\n"
-        yield f"⚡ **Note**: The RAG system is fully functional - document search and retrieval working perfectly! "
-        yield f"In a production environment with adequate resources, the LLM would analyze these documents and provide a complete answer.\n\n"
-        
-        # Try LLM but don't wait too long
-        yield f"🤖 **Attempting LLM response** (will timeout if too slow)...\n\n"
+        if extracts is not None:
+            # Answer from the retrieved sentences right away; the LLM only on request
+            text = answer_text(extracts)
+            yield {"event": "extractive", "data": json.dumps({"answer": text, "extracts": to_dicts(extracts)})}
+            record_route(EXTRACTIVE, extract_seconds)
+            if not upgrade:
+                if turn:
+                    sessions.finish(turn, q, text, None)
+                yield {"event": "done", "data": json.dumps({"model": None, "route": EXTRACTIVE.name})}
+                return
+        else:
+            # Provide immediate fallback with document retrieval results
+            yield f"🔍 **Found relevant documents for: {q}**\n\n"
+
+            for i, ctx in enumerate(contexts[:2], 1):
+                yield f"**Document {i}**: {ctx[:300]}...\n\n"
+
+            yield f"📊 **Summary**: Retrieved {len(contexts)} relevant passages from your indexed documents.\n\n"
+            yield f"⚡ **Note**: The RAG system is fully functional - document search and retrieval working perfectly! "
+            yield f"In a production environment with adequate resources, the LLM would analyze these documents and provide a complete answer.\n\n"
+
+            # Try LLM but don't wait too long
+            yield f"🤖 **Attempting LLM response** (will timeout if too slow)...\n\n"
         
+        done: dict = {}
+        answer: List[str] = []
+        stats = StreamStats()
+        upstream = ollama.stream(
+            chosen.model,
+            prompt, 
+            tenant.settings.llm_temperature,
+            max_tokens=100,  # Very short for speed
+            timeout=15.0,    # Shorter timeout
+            context=turn.context if turn else None,
+            on_done=done.update,
+        )
+        response_started = False
         try:
-            response_started = False
-            async for tok in ollama.stream(
-                settings.llm_model, 
-                prompt, 
-                settings.llm_temperature,
-                max_tokens=100,  # Very short for speed
-                timeout=15.0     # Shorter timeout
-            ):
-                if not response_started:
-                    yield f"**LLM Response**: "
-                    response_started = True
-                yield tok
+            # Closing the relay on disconnect cancels the Ollama request
+            async with aclosing(relay(upstream, stats, settings.stream_buffer_tokens)) as tokens:
+                async for tok in tokens:
+                    if not response_started:
+                        yield f"**LLM Response**: "
+                        response_started = True
+                    answer.append(tok)
+                    yield tok
+            if turn and done:
+                sessions.finish(turn, q, "".join(answer), done.get("context"))
+            record_route(chosen, time.perf_counter() - stats.started)
+            yield {"event": "done", "data": json.dumps({**stats.report(), "model": chosen.model, "route": chosen.name})}
         except Exception:
             if not response_started:
                 yield f"**LLM Response**: Timed out in this environment, but document retrieval is working perfectly!"
-
-    return EventSourceResponse(gen())
-
-
-@app.get("/chat/demo")
-async def chat_demo(q: str):
+        finally:
+            stats.record("chat")
+
+    return EventSourceResponse(gen(), ping=settings.sse_ping_seconds, send_timeout=settings.sse_send_timeout)
+
+
+@app.get("/chat/demo", dependencies=[Depends(require_ready), Depends(rate_limit("retrieval"))])
+async def chat_demo(
+    q: str,
+    folder: Optional[List[str]] = Query(None),
+    file_type: Optional[List[str]] = Query(None),
+    tag: Optional[List[str]] = Query(None),
+    mmr_lambda: Optional[float] = Query(None, ge=0.0, le=1.0),
+    max_per_source: Optional[int] = Query(None, ge=0),
+    tenant: Tenant = Depends(get_tenant),
+):
     """Demo endpoint that shows document retrieval without LLM processing"""
-    from .embeddings import embeddings
-    from .vectorstore import vs
+    from .retrieval import retrieve
 
-    query_text = f"query: {q}"
-    qvec = embeddings.embed_query(query_text)
-    results = vs.search(qvec, top_k=settings.top_k)
     contexts = []
     sources = []
     
-    for r in results:
-        payload = r.payload or {}
-        if isinstance(payload, dict):
-            txt = payload.get("text")
-            src = payload.get("source") 
-            if txt:
-                contexts.append(str(txt))
-                sources.append(src or "Unknown")
+    hits = await run_in_threadpool(
+        retrieve,
+        tenant,
+        q,
+        filters=_query_filters(folder, file_type, tag),
+        expand=True,
+        diversity=_query_diversity(mmr_lambda, max_per_source),
+    )
+    for hit in hits:
+        if hit.text:
+            contexts.append(hit.text)
+            sources.append(hit.source or "Unknown")
     
     return {
         "query": q,
@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+from typing import Dict
+
+from .state import StateBackend, shared_state
+
+
+class Metrics:
+    """Counters summed across workers via the shared state backend."""
+
+    def __init__(self, state: StateBackend = shared_state, prefix: str = "metrics:"):
+        self.state = state
+        self.prefix = prefix
+
+    def incr(self, name: str, value: float = 1) -> None:
+        self.state.update(self.prefix + name, lambda current: (current or 0) + value)
+
+    def add_many(self, values: Dict[str, float]) -> None:
+        for name, value in values.items():
+            if value:
+                self.incr(name, value)
+
+    def snapshot(self) -> Dict[str, float]:
+        return {k[len(self.prefix):]: v for k, v in sorted(self.state.items(self.prefix).items())}
+
+
+metrics = Metrics()
@@ -0,0 +1,389 @@
+from __future__ import annotations
+
+import csv
+import email
+import io
+import mimetypes
+import re
+import time
+import zipfile
+from dataclasses import dataclass
+from email import policy
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+from xml.etree import ElementTree
+
+from pypdf import PdfReader
+
+from .metrics import metrics
+
+
+class Section(NamedTuple):
+    text: str
+    page: Optional[int] = None  # 1-based, for paged formats
+    scanned: bool = False  # page is an image without a text layer
+
+
+# A parser yields a document as a stream of sections (pages, headed sections,
+# row blocks) so that no whole-document string is built; plain strings are
+# sections without a page. Headings are emitted as Markdown "#" lines, which
+# the structured chunker splits on.
+ParseFn = Callable[[Path], Iterator[Union[str, Section]]]
+
+_SECTION_CHARS = 16_000  # text parsers yield at paragraph breaks past this size
+_SNIFF_BYTES = 2048
+_PDF_CACHE_PAGES = 50  # pages between flushes of pypdf's parsed object cache
+_SCANNED_MAX_CHARS = 20  # less text than this on a page with an image: a scan
+
+
+@dataclass
+class Parser:
+    name: str
+    extensions: Tuple[str, ...]
+    mime_types: Tuple[str, ...]
+    parse: ParseFn
+    front_matter: bool = False  # leading YAML front matter holds metadata
+
+
+PARSERS: Dict[str, Parser] = {}
+_BY_EXT: Dict[str, Parser] = {}
+_BY_MIME: Dict[str, Parser] = {}
+
+
+def register(name: str, extensions: Tuple[str, ...], mime_types: Tuple[str, ...] = (), front_matter: bool = False):
+    """Decorator adding a parse function to the registry; later registrations win."""
+
+    def wrap(fn: ParseFn) -> ParseFn:
+        parser = Parser(name, extensions, mime_types, fn, front_matter)
+        PARSERS[name] = parser
+        for ext in extensions:
+            _BY_EXT[ext] = parser
+        for mime in mime_types:
+            _BY_MIME[mime] = parser
+        return fn
+
+    return wrap
+
+
+def extensions() -> List[str]:
+    return sorted(_BY_EXT)
+
+
+def sniff_mime(path: Path) -> Optional[str]:
+    """MIME type from the first bytes of the file, for names without a known extension."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(_SNIFF_BYTES)
+    except OSError:
+        return None
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    if head.startswith(b"PK\x03\x04"):
+        try:
+            with zipfile.ZipFile(path) as z:
+                if "word/document.xml" in z.namelist():
+                    return "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        except zipfile.BadZipFile:
+            pass
+        return None
+    text = head.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if text.startswith((b"<!doctype html", b"<html")):
+        return "text/html"
+    if re.match(rb"(return-path|received|from|message-id|mime-version|subject|date|to|delivered-to):", text):
+        return "message/rfc822"
+    return None
+
+
+def parser_for(path: Path) -> Optional[Parser]:
+    """Parser by extension, then by the guessed or sniffed MIME type."""
+    parser = _BY_EXT.get(path.suffix.lower())
+    if parser is not None:
+        return parser
+    guessed = mimetypes.guess_type(path.name)[0]
+    if guessed in _BY_MIME:
+        return _BY_MIME[guessed]
+    return _BY_MIME.get(sniff_mime(path))
+
+
+@dataclass
+class ParseStats:
+    parser: str
+    files: int = 0
+    bytes: int = 0
+    sections: int = 0
+    empty: int = 0  # sections without text, skipped
+    scanned: int = 0  # pages that need OCR
+    chars: int = 0
+    seconds: float = 0.0
+
+    def merge(self, other: "ParseStats") -> None:
+        self.files += other.files
+        self.bytes += other.bytes
+        self.sections += other.sections
+        self.empty += other.empty
+        self.scanned += other.scanned
+        self.chars += other.chars
+        self.seconds += other.seconds
+
+
+def timed(sections: Iterator[Union[str, Section]], stats: ParseStats) -> Iterator[Section]:
+    """Sections with text, counting only the time spent inside the parser."""
+    t0 = time.perf_counter()
+    for section in sections:
+        stats.seconds += time.perf_counter() - t0
+        if isinstance(section, str):
+            section = Section(section)
+        stats.sections += 1
+        stats.scanned += section.scanned
+        if section.text.strip():
+            stats.chars += len(section.text)
+            yield section
+        else:
+            stats.empty += 1
+        t0 = time.perf_counter()
+    stats.seconds += time.perf_counter() - t0
+
+
+def record_stats(stats: Dict[str, ParseStats]) -> None:
+    for s in stats.values():
+        mb = s.bytes / 1e6
+        rate = f"{mb / s.seconds:.1f} MB/s" if s.seconds else "n/a"
+        skipped = f", {s.empty} empty" if s.empty else ""
+        if s.scanned:
+            skipped += f", {s.scanned} scanned without text (need OCR)"
+        print(f"Parsed {s.files} {s.parser} files ({mb:.1f} MB, {s.sections} sections{skipped}) in {s.seconds:.2f}s: {rate}")
+        metrics.add_many(
+            {
+                f"parser.{s.parser}.files": s.files,
+                f"parser.{s.parser}.bytes": s.bytes,
+                f"parser.{s.parser}.sections": s.sections,
+                f"parser.{s.parser}.empty": s.empty,
+                f"parser.{s.parser}.scanned": s.scanned,
+                f"parser.{s.parser}.seconds": round(s.seconds, 4),
+            }
+        )
+
+
+def parser_report() -> List[dict]:
+    snapshot = metrics.snapshot()
+    out = []
+    for name, parser in PARSERS.items():
+        seconds = snapshot.get(f"parser.{name}.seconds", 0.0)
+        size = snapshot.get(f"parser.{name}.bytes", 0)
+        out.append(
+            {
+                "name": name,
+                "extensions": list(parser.extensions),
+                "mime_types": list(parser.mime_types),
+                "files": snapshot.get(f"parser.{name}.files", 0),
+                "empty_sections": snapshot.get(f"parser.{name}.empty", 0),
+                "scanned_pages": snapshot.get(f"parser.{name}.scanned", 0),
+                "mb_per_second": round(size / 1e6 / seconds, 2) if seconds else None,
+            }
+        )
+    return out
+
+
+# --- Parsers -----------------------------------------------------------------
+
+
+def paragraph_blocks(lines: Iterable[str]) -> Iterator[str]:
+    """Group lines into sections of about _SECTION_CHARS, cut at blank lines."""
+    buf: List[str] = []
+    size = 0
+    for line in lines:
+        if size >= _SECTION_CHARS and not line.strip():
+            yield "".join(buf)
+            buf, size = [], 0
+        buf.append(line)
+        size += len(line)
+    if buf:
+        yield "".join(buf)
+
+
+@register("text", (".txt", ".md", ".markdown", ".rst"), ("text/plain", "text/markdown"), front_matter=True)
+def parse_text(path: Path) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        yield from paragraph_blocks(f)
+
+
+def _has_image(page) -> bool:
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources is not None else None
+    if xobjects is None:
+        return False
+    return any(ref.get_object().get("/Subtype") == "/Image" for ref in xobjects.get_object().values())
+
+
+@register("pdf", (".pdf",), ("application/pdf",))
+def parse_pdf(path: Path) -> Iterator[Section]:
+    # A file object keeps pypdf reading from disk; given a path it loads the whole file
+    with open(path, "rb") as f:
+        reader = PdfReader(f)
+        for number in range(1, len(reader.pages) + 1):
+            page = reader.pages[number - 1]
+            text = page.extract_text() or ""
+            scanned = len(text.strip()) < _SCANNED_MAX_CHARS and _has_image(page)
+            yield Section("" if scanned else text, number, scanned)
+            if number % _PDF_CACHE_PAGES == 0:
+                # Decoded content streams and fonts pile up here; later pages re-read what they need
+                reader.resolved_objects.clear()
+
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_HEADING_STYLE = re.compile(r"^heading\s*(\d)$|^title$", re.IGNORECASE)
+
+
+def _docx_text(elem: ElementTree.Element) -> str:
+    return "".join(t.text or "" for t in elem.iter(f"{_W}t")).strip()
+
+
+def _docx_table(tbl: ElementTree.Element) -> str:
+    rows = (" | ".join(_docx_text(cell) for cell in row.iter(f"{_W}tc")) for row in tbl.iter(f"{_W}tr"))
+    return "\n".join(r for r in rows if r.strip(" |"))
+
+
+@register("docx", (".docx",), ("application/vnd.openxmlformats-officedocument.wordprocessingml.document",))
+def parse_docx(path: Path) -> Iterator[str]:
+    buf: List[str] = []
+    size = 0
+    tables = 0  # depth; paragraphs in cells are read with their table
+    with zipfile.ZipFile(path) as z, z.open("word/document.xml") as f:
+        for event, elem in ElementTree.iterparse(f, events=("start", "end")):
+            if elem.tag == f"{_W}tbl":
+                tables += 1 if event == "start" else -1
+                if event == "start" or tables:
+                    continue
+                line = _docx_table(elem)
+            elif event == "end" and elem.tag == f"{_W}p" and not tables:
+                line = _docx_text(elem)
+                style = elem.find(f"{_W}pPr/{_W}pStyle")
+                m = _HEADING_STYLE.match(style.get(f"{_W}val", "")) if style is not None else None
+                if line and m:
+                    line = "#" * int(m.group(1) or 1) + " " + line
+                    # A heading starts a new section once the current one has some size
+                    if size >= _SECTION_CHARS // 4:
+                        yield "\n\n".join(buf)
+                        buf, size = [], 0
+            else:
+                continue
+            elem.clear()
+            if line:
+                buf.append(line)
+                size += len(line)
+            if size >= _SECTION_CHARS:
+                yield "\n\n".join(buf)
+                buf, size = [], 0
+    if buf:
+        yield "\n\n".join(buf)
+
+
+class _HTMLText(HTMLParser):
+    """Visible text of an HTML document, with headings as Markdown and block breaks."""
+
+    _SKIP = {"script", "style", "noscript", "template", "svg", "head"}
+    _BLOCK = {"p", "div", "br", "li", "tr", "section", "article", "blockquote", "pre", "table", "ul", "ol", "hr"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.size = 0
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP:
+            self._skip += 1
+        elif tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            self.parts.append("\n\n" + "#" * int(tag[1]) + " ")
+        elif tag in self._BLOCK:
+            self.parts.append("\n\n" if tag == "p" else "\n")
+        elif tag in ("td", "th"):
+            self.parts.append(" | ")
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP:
+            self._skip = max(0, self._skip - 1)
+        elif tag in ("h1", "h2", "h3", "h4", "h5", "h6", "p", "li"):
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip and data.strip():
+            text = " ".join(data.split())
+            if self.parts and not self.parts[-1].endswith(("\n", " ")):
+                text = " " + text
+            self.parts.append(text)
+            self.size += len(text)
+
+    def take(self) -> str:
+        text = re.sub(r"\n{3,}", "\n\n", "".join(self.parts)).strip()
+        self.parts, self.size = [], 0
+        return text
+
+
+def html_sections(chunks: Iterator[str]) -> Iterator[str]:
+    html = _HTMLText()
+    for chunk in chunks:
+        html.feed(chunk)
+        if html.size >= _SECTION_CHARS:
+            text = html.take()
+            if text:
+                yield text
+    html.close()
+    text = html.take()
+    if text:
+        yield text
+
+
+@register("html", (".html", ".htm", ".xhtml"), ("text/html", "application/xhtml+xml"))
+def parse_html(path: Path) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        yield from html_sections(iter(lambda: f.read(64 * 1024), ""))
+
+
+@register("csv", (".csv", ".tsv"), ("text/csv", "text/tab-separated-values"))
+def parse_csv(path: Path) -> Iterator[str]:
+    # Each row becomes "column: value; ..." so a chunk stays meaningful without the header
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        sample = f.read(8192)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel_tab if path.suffix.lower() == ".tsv" else csv.excel
+        reader = csv.reader(f, dialect)
+        header = next(reader, None)
+        if not header:
+            return
+        header = [h.strip() or f"column {i + 1}" for i, h in enumerate(header)]
+        buf: List[str] = []
+        size = 0
+        for row in reader:
+            line = "; ".join(f"{h}: {v.strip()}" for h, v in zip(header, row) if v.strip())
+            if not line:
+                continue
+            buf.append(line)
+            size += len(line)
+            if size >= _SECTION_CHARS:
+                yield "\n".join(buf)
+                buf, size = [], 0
+        if buf:
+            yield "\n".join(buf)
+
+
+@register("email", (".eml",), ("message/rfc822",))
+def parse_email(path: Path) -> Iterator[str]:
+    with open(path, "rb") as f:
+        msg = email.message_from_binary_file(f, policy=policy.default)
+    headers = [f"{h}: {msg[h]}" for h in ("Subject", "From", "To", "Cc", "Date") if msg[h]]
+    if headers:
+        yield "\n".join(headers)
+    # Prefer the plain text alternative; attachments are not indexed
+    body = msg.get_body(preferencelist=("plain", "html"))
+    if body is None:
+        return
+    content = body.get_content()
+    if body.get_content_subtype() == "html":
+        yield from html_sections(iter([content]))
+    else:
+        yield from paragraph_blocks(io.StringIO(content))
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import time
+
+from fastapi import HTTPException, Request
+
+from .config import Settings, settings
+from .metrics import metrics
+from .state import StateBackend, shared_state
+
+
+BUDGETS = ("retrieval", "generation", "ingest")
+_PURGE_EVERY = 1000  # bucket checks per worker between purges of expired buckets
+
+
+class RateLimiter:
+    """Token buckets per client and budget, kept in shared state so all workers enforce one limit.
+
+    A client is its API key (hashed) or else its IP. A bucket holds up to burst
+    tokens and refills at per_minute / 60 per second; a request costs one token,
+    a batch one per query. A batch larger than the burst is let through on a
+    full bucket and leaves it in debt, so its size is paid for in waiting time.
+    """
+
+    def __init__(self, state: StateBackend = shared_state, cfg: Settings = settings):
+        self.state = state
+        self.cfg = cfg
+        self._checks = 0
+
+    def client(self, request: Request) -> str:
+        key = request.headers.get(self.cfg.rate_limit_key_header)
+        if key:
+            # Keys are secrets; the state only sees a digest
+            return "key:" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+        if self.cfg.rate_limit_trust_forwarded:
+            forwarded = request.headers.get("x-forwarded-for")
+            if forwarded:
+                return "ip:" + forwarded.split(",")[0].strip()
+        return "ip:" + (request.client.host if request.client else "unknown")
+
+    def take(self, client: str, budget: str, cost: int = 1) -> float:
+        """Debit the bucket; returns 0 if allowed, else the seconds until it would be."""
+        limit = self.cfg.rate_limits.get(budget) or {}
+        per_minute = float(limit.get("per_minute") or 0)
+        if not self.cfg.rate_limit_enabled or per_minute <= 0:
+            return 0.0
+        rate = per_minute / 60.0
+        capacity = max(1.0, float(limit.get("burst") or 1))
+        need = min(cost, capacity)
+        now = time.time()
+        wait = [0.0]
+
+        def refill(current):
+            tokens, at = (current["tokens"], current["at"]) if current else (capacity, now)
+            tokens = min(capacity, tokens + (now - at) * rate)
+            if tokens >= need:
+                tokens -= cost
+            else:
+                wait[0] = (need - tokens) / rate
+            return {"tokens": tokens, "at": now}
+
+        # Once the bucket would be full again the entry carries no information
+        self.state.update(f"ratelimit:{budget}:{client}", refill, ttl=(capacity + cost) / rate)
+        self._checks += 1
+        if self._checks % _PURGE_EVERY == 0:
+            self.state.purge()
+        return wait[0]
+
+    def check(self, request: Request, budget: str, cost: int = 1) -> None:
+        wait = self.take(self.client(request), budget, cost)
+        if wait:
+            metrics.incr(f"ratelimit.{budget}.rejected")
+            raise HTTPException(
+                status_code=429,
+                detail=f"Rate limit for {budget} requests exceeded, retry in {math.ceil(wait)}s",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+
+limiter = RateLimiter()
+
+
+def rate_limit(budget: str):
+    """Route dependency charging one request to the client's budget."""
+
+    def dependency(request: Request) -> None:
+        limiter.check(request, budget)
+
+    return dependency
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+from pydantic import BaseModel, Field
+from qdrant_client.http import models as qmodels
+
+from .chunking import approx_token_counts
+from .tenants import Tenant
+
+
+@dataclass
+class Hit:
+    id: int
+    score: float
+    text: Optional[str]
+    source: Optional[str]
+    payload: dict = field(default_factory=dict)
+    # The matched chunk's own text; text is its parent section after expansion
+    chunk: Optional[str] = None
+
+
+class SearchFilters(BaseModel):
+    """Metadata constraints pushed down into the vector search; lists match any value."""
+
+    folder: str | List[str] | None = None  # includes subfolders
+    file_type: str | List[str] | None = None
+    tags: List[str] | None = None
+    modified_after: datetime | None = None
+    modified_before: datetime | None = None
+
+
+class Diversity(BaseModel):
+    """Per-request overrides of the MMR / per-source limits (None = tenant setting)."""
+
+    mmr_lambda: float | None = Field(None, ge=0.0, le=1.0)  # 1.0 = relevance only
+    fetch_k: int | None = Field(None, ge=1, le=200)  # candidates over-fetched for reranking
+    max_per_source: int | None = Field(None, ge=0)  # 0 = no limit
+
+
+def _as_list(value: str | List[str] | None, normalize) -> List[str]:
+    if value is None:
+        return []
+    values = [value] if isinstance(value, str) else value
+    return [v for v in (normalize(v) for v in values) if v]
+
+
+def build_filter(filters: Optional[SearchFilters]) -> Optional[qmodels.Filter]:
+    if filters is None:
+        return None
+    must: List[qmodels.Condition] = []
+    for key, values in (
+        ("folders", _as_list(filters.folder, lambda v: v.strip().strip("/"))),
+        ("file_type", _as_list(filters.file_type, lambda v: v.strip().lower().lstrip("."))),
+        ("tags", _as_list(filters.tags, lambda v: v.strip().lower())),
+    ):
+        if values:
+            must.append(qmodels.FieldCondition(key=key, match=qmodels.MatchAny(any=values)))
+    if filters.modified_after or filters.modified_before:
+        must.append(
+            qmodels.FieldCondition(
+                key="mtime",
+                range=qmodels.Range(
+                    gte=filters.modified_after.timestamp() if filters.modified_after else None,
+                    lte=filters.modified_before.timestamp() if filters.modified_before else None,
+                ),
+            )
+        )
+    return qmodels.Filter(must=must) if must else None
+
+
+def retrieve(
+    tenant: Tenant,
+    query: str,
+    top_k: Optional[int] = None,
+    filters: Optional[SearchFilters] = None,
+    expand: bool = False,
+    diversity: Optional[Diversity] = None,
+) -> List[Hit]:
+    """Embed the query, search the tenant's collection and attach chunk text from its store.
+
+    Candidates are diversified with MMR (see diversify). With expand=True hits are
+    replaced by their parent sections (see expand_parents).
+    """
+    top_k = top_k or tenant.settings.top_k
+    lam, fetch_k, per_source = _diversity(tenant, top_k, diversity)
+    # E5 recommends query prefix
+    qvec = tenant.embeddings.embed_query(f"query: {query}")
+    results = tenant.vs.search(qvec, top_k=fetch_k, filter=build_filter(filters), with_vectors=lam < 1.0)
+    results = diversify(qvec, results, top_k, lam, per_source)
+    return _to_hits(tenant, [results], expand)[0]
+
+
+def retrieve_batch(
+    tenant: Tenant,
+    queries: List[str],
+    top_k: Optional[int] = None,
+    filters: Optional[List[Optional[SearchFilters]]] = None,
+    expand: bool = False,
+    diversity: Optional[Diversity] = None,
+) -> List[List[Hit]]:
+    """Like retrieve() for many queries: one encode call, one Qdrant batch search, one text fetch."""
+    if not queries:
+        return []
+    top_k = top_k or tenant.settings.top_k
+    lam, fetch_k, per_source = _diversity(tenant, top_k, diversity)
+    vectors = tenant.embeddings.embed([f"query: {q}" for q in queries])
+    filters = filters or [None] * len(queries)
+    results = tenant.vs.search_batch(
+        vectors, top_k=fetch_k, filters=[build_filter(f) for f in filters], with_vectors=lam < 1.0
+    )
+    results = [diversify(v, r, top_k, lam, per_source) for v, r in zip(vectors, results)]
+    return _to_hits(tenant, results, expand)
+
+
+def _diversity(tenant: Tenant, top_k: int, diversity: Optional[Diversity]):
+    cfg = tenant.settings
+    d = diversity or Diversity()
+    lam = cfg.mmr_lambda if d.mmr_lambda is None else d.mmr_lambda
+    per_source = cfg.max_per_source if d.max_per_source is None else d.max_per_source
+    fetch_k = cfg.mmr_fetch_k if d.fetch_k is None else d.fetch_k
+    if lam >= 1.0 and not per_source:
+        # Nothing to rerank; fetch exactly top_k
+        return 1.0, top_k, 0
+    return lam, max(top_k, fetch_k), per_source
+
+
+def diversify(query_vector, results, top_k: int, lam: float, max_per_source: int = 0):
+    """Pick top_k of the over-fetched results by maximal marginal relevance.
+
+    Each step takes the candidate maximizing lam * sim(query) - (1 - lam) * max
+    sim(already picked), skipping sources that hit max_per_source. Similarities
+    are one (n, n) matrix product, so 20-50 candidates cost well under a millisecond.
+    """
+    if len(results) <= top_k and not max_per_source:
+        return results
+    n = len(results)
+    relevance = np.array([r.score for r in results], dtype=np.float32)
+    redundancy = None
+    if lam < 1.0 and all(r.vector is not None for r in results):
+        vecs = np.asarray([r.vector for r in results], dtype=np.float32)
+        vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        q = np.asarray(query_vector, dtype=np.float32)
+        relevance = vecs @ (q / max(float(np.linalg.norm(q)), 1e-12))
+        redundancy = vecs @ vecs.T
+    sources = [(r.payload or {}).get("source") for r in results]
+    per_source: dict = {}
+    available = np.ones(n, dtype=bool)
+    closest = np.zeros(n, dtype=np.float32)
+    picked: List[int] = []
+    while len(picked) < top_k and available.any():
+        score = relevance if redundancy is None or not picked else lam * relevance - (1 - lam) * closest
+        i = int(np.argmax(np.where(available, score, -np.inf)))
+        available[i] = False
+        src = sources[i]
+        if max_per_source and src is not None:
+            if per_source.get(src, 0) >= max_per_source:
+                continue
+            per_source[src] = per_source.get(src, 0) + 1
+        picked.append(i)
+        if redundancy is not None:
+            closest = np.maximum(closest, redundancy[i])
+    return [results[i] for i in picked]
+
+
+def _text_id(r, expand: bool) -> int:
+    payload = r.payload if isinstance(r.payload, dict) else {}
+    return payload.get("parent_id", r.id) if expand else r.id
+
+
+def _to_hits(tenant: Tenant, result_lists, expand: bool = False) -> List[List[Hit]]:
+    # One store lookup for every list; with expand the parent sections and the matched chunks
+    ids = {i for results in result_lists for r in results for i in {r.id, _text_id(r, expand)}}
+    texts = tenant.chunk_store.get_many(ids)
+    out: List[List[Hit]] = []
+    for results in result_lists:
+        hits: List[Hit] = []
+        for r in results:
+            payload = r.payload if isinstance(r.payload, dict) else {}
+            # Points indexed before the chunk store still carry their text in the payload
+            chunk = texts.get(r.id) or payload.get("text")
+            text = texts.get(_text_id(r, expand)) or chunk
+            hits.append(
+                Hit(id=r.id, score=r.score, text=text, source=payload.get("source"), payload=payload, chunk=chunk)
+            )
+        out.append(expand_parents(hits, tenant.settings.context_max_tokens) if expand else hits)
+    return out
+
+
+def expand_parents(hits: List[Hit], max_tokens: int) -> List[Hit]:
+    """Collapse child hits onto their parent sections, best score first.
+
+    Children of the same parent yield one section; sections are added until the
+    token budget is spent, but the best one is always kept.
+    """
+    out: List[Hit] = []
+    seen = set()
+    used = 0
+    for hit in hits:
+        key = hit.payload.get("parent_id", hit.id)
+        if key in seen:
+            continue
+        seen.add(key)
+        size = approx_token_counts([hit.text or ""])[0]
+        if out and used + size > max_tokens:
+            continue
+        out.append(hit)
+        used += size
+    return out
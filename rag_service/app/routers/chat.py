@@ -1,14 +1,26 @@
 from __future__ import annotations
 
-from typing import List
+import asyncio
+import json
+import time
+from typing import AsyncGenerator, Dict, List, Optional
 
-from fastapi import APIRouter
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 
 from ..config import settings
-from ..embeddings import embeddings
+from ..extractive import answer_text, fast_answer, to_dicts
 from ..llm import ollama
-from ..vectorstore import vs
+from ..ratelimit import limiter, rate_limit
+from ..retrieval import Diversity, Hit, SearchFilters, retrieve
+from ..routing import EXTRACTIVE, Route, record_route, route_query, route_stats
+from ..sessions import SessionTurn, sessions
+from ..state import get_active_model
+from ..tenants import Tenant, get_tenant
+from ..warmup import require_ready
+from .retrieve import BatchRequest, hit_to_dict, run_batch
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
@@ -17,60 +29,204 @@ class ChatRequest(BaseModel):
     query: str
     stream: bool = False
     top_k: int | None = None
+    filters: SearchFilters | None = None
+    diversity: Diversity | None = None
+    session_id: str | None = Field(None, max_length=64)  # from POST /chat/sessions
+    route: str | None = Field(None, pattern="^(extractive|small|large)$")  # skip automatic routing
 
 
-def build_prompt(query: str, contexts: List[str]) -> str:
+class ChatBatchRequest(BatchRequest):
+    stream: bool = True  # NDJSON lines as answers finish, in completion order
+    expand: bool = True
+
+
+def contexts_for(hits: List[Hit]) -> List[str]:
+    contexts: List[str] = []
+    for hit in hits:
+        if hit.text:
+            contexts.append(hit.text)
+        elif hit.source:
+            contexts.append(f"See: {hit.source}")
+    return contexts or ["No specific context retrieved."]
+
+
+def build_prompt(
+    query: str,
+    contexts: List[str],
+    system_prompt: str | None = None,
+    history: Optional[List[Dict[str, str]]] = None,
+    continuing: bool = False,
+) -> str:
+    """Stable parts first (system, then history) so consecutive turns share a prompt prefix.
+
+    With continuing=True the system prompt and history are already in the Ollama
+    context passed along, and only the new turn is sent.
+    """
     context_block = "\n\n".join(f"- {c}" for c in contexts)
+    head = ""
+    if not continuing:
+        head = f"System: {system_prompt or settings.system_prompt}\n\n"
+        if history:
+            lines = "\n".join(f"User: {t['user']}\nAssistant: {t['assistant']}" for t in history)
+            head += f"Conversation so far:\n{lines}\n\n"
     return (
-        f"System: {settings.system_prompt}\n\n"
+        f"{head}"
         f"Context:\n{context_block}\n\n"
         f"User question: {query}\n\n"
         f"Answer:"
     )
 
 
-@router.post("/ask")
-async def ask(req: ChatRequest):
+def session_prompt(
+    turn: Optional[SessionTurn], query: str, contexts: List[str], system_prompt: str, max_tokens: int
+) -> str:
+    if turn is None:
+        return build_prompt(query, contexts, system_prompt)
+    if turn.context is not None:
+        prompt = build_prompt(query, contexts, system_prompt, continuing=True)
+        if sessions.keep_context(turn, prompt, max_tokens):
+            return prompt
+    return build_prompt(query, contexts, system_prompt, history=turn.history)
+
+
+def choose_route(
+    tenant: Tenant, query: str, hits: List[Hit], turn: Optional[SessionTurn] = None, force: Optional[str] = None
+) -> Route:
+    route = route_query(query, hits, tenant.settings, force)
+    if turn is not None and turn.model != route.model:
+        sessions.use_model(turn, route.model)
+    return route
+
+
+@router.get("/routes")
+async def get_routes():
+    """Requests and average generation latency per route, summed across workers."""
+    return route_stats()
+
+
+@router.post("/sessions")
+async def create_session(tenant: Tenant = Depends(get_tenant)):
+    return {"session_id": sessions.create(tenant.name)}
+
+
+@router.get("/sessions/{session_id}")
+async def get_session(session_id: str, tenant: Tenant = Depends(get_tenant)):
+    turns = sessions.history(tenant.name, session_id)
+    if turns is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return {"session_id": session_id, "turns": turns}
+
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str, tenant: Tenant = Depends(get_tenant)):
+    sessions.delete(tenant.name, session_id)
+    return {"deleted": session_id}
+
+
+@router.post("/ask", dependencies=[Depends(require_ready), Depends(rate_limit("generation"))])
+async def ask(req: ChatRequest, tenant: Tenant = Depends(get_tenant)):
     q = req.query.strip()
     if not q:
         return {"answer": ""}
 
-    # E5 recommends query prefix
-    query_text = f"query: {q}"
-    qvec = embeddings.embed_query(query_text)
-    results = vs.search(qvec, top_k=req.top_k or settings.top_k)
-    final_contexts: List[str] = []
-    for r in results:
-        payload = r.payload or {}
-        if isinstance(payload, dict):
-            txt = payload.get("text")
-            if txt:
-                final_contexts.append(str(txt))
-            elif payload.get("source"):
-                final_contexts.append(f"See: {payload['source']}")
-    if not final_contexts:
-        final_contexts = ["No specific context retrieved."]
-
-    prompt = build_prompt(q, final_contexts)
-
-    if req.stream:
-        # Note: Streaming is served via SSE in main app route /chat/stream
-        ans = await ollama.generate(
-            settings.llm_model, 
-            prompt, 
-            settings.llm_temperature, 
-            system=None,
-            max_tokens=200,
-            timeout=30.0
-        )
-        return {"answer": ans, "sources": final_contexts}
+    turn = sessions.begin(tenant.name, req.session_id, q, get_active_model()) if req.session_id else None
+    # Embedding and the synchronous Qdrant client block; keep them off the event loop
+    hits = await run_in_threadpool(
+        retrieve,
+        tenant,
+        turn.search_query if turn else q,
+        top_k=req.top_k,
+        filters=req.filters,
+        expand=True,
+        diversity=req.diversity,
+    )
+    final_contexts = contexts_for(hits)
+    t0 = time.perf_counter()
+    extracts = fast_answer(q, hits, tenant.settings, req.route)
+    if extracts is not None:
+        ans = answer_text(extracts)
+        record_route(EXTRACTIVE, time.perf_counter() - t0)
+        out = {"answer": ans, "sources": final_contexts, "model": None, "route": EXTRACTIVE.name}
+        out["extracts"] = to_dicts(extracts)
+        if turn:
+            sessions.finish(turn, q, ans, None)
+            out["session_id"] = turn.session_id
+        return out
+    route = choose_route(tenant, q, hits, turn, req.route)
+
+    prompt = session_prompt(turn, q, final_contexts, tenant.settings.system_prompt, max_tokens=200)
 
+    # Note: Streaming is served via SSE in main app route /chat/stream
+    done: Dict = {}
+    t0 = time.perf_counter()
     ans = await ollama.generate(
-        settings.llm_model, 
-        prompt, 
-        settings.llm_temperature, 
+        route.model,
+        prompt,
+        tenant.settings.llm_temperature,
         system=None,
         max_tokens=200,
-        timeout=30.0
+        timeout=30.0,
+        context=turn.context if turn else None,
+        on_done=done.update,
     )
-    return {"answer": ans, "sources": final_contexts}
+    record_route(route, time.perf_counter() - t0)
+    out = {"answer": ans, "sources": final_contexts, "model": route.model, "route": route.name}
+    if turn:
+        # Only completed generations become history; errors come back as text without "done"
+        if done:
+            sessions.finish(turn, q, ans, done.get("context"))
+        out["session_id"] = turn.session_id
+    return out
+
+
+@router.post("/batch", dependencies=[Depends(require_ready)])
+async def ask_batch(req: ChatBatchRequest, request: Request, tenant: Tenant = Depends(get_tenant)):
+    """Answer many questions: batched retrieval, then generation with bounded concurrency."""
+    limiter.check(request, "generation", cost=len(req.queries))
+    results = await run_batch(req, tenant)
+    sem = asyncio.Semaphore(max(1, settings.batch_llm_concurrency))
+
+    async def answer(i: int) -> dict:
+        q = req.queries[i]
+        contexts = contexts_for(results[i])
+        out = {"index": i, "id": q.id, "query": q.query, "sources": [hit_to_dict(h) for h in results[i]]}
+        t0 = time.perf_counter()
+        extracts = fast_answer(q.query.strip(), results[i], tenant.settings)
+        if extracts is not None:
+            record_route(EXTRACTIVE, time.perf_counter() - t0)
+            out.update(model=None, route=EXTRACTIVE.name, answer=answer_text(extracts), extracts=to_dicts(extracts))
+            return out
+        route = choose_route(tenant, q.query.strip(), results[i])
+        out.update(model=route.model, route=route.name)
+        try:
+            async with sem:
+                t0 = time.perf_counter()
+                out["answer"] = await ollama.generate(
+                    route.model,
+                    build_prompt(q.query.strip(), contexts, tenant.settings.system_prompt),
+                    tenant.settings.llm_temperature,
+                    system=None,
+                    max_tokens=200,
+                    timeout=30.0,
+                )
+                record_route(route, time.perf_counter() - t0)
+        except Exception as e:
+            # One failed generation must not abort the rest of the batch
+            out["answer"] = None
+            out["error"] = str(e)
+        return out
+
+    tasks = [asyncio.create_task(answer(i)) for i in range(len(req.queries))]
+    if not req.stream:
+        return {"results": await asyncio.gather(*tasks)}
+
+    async def lines() -> AsyncGenerator[str, None]:
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield json.dumps(await done) + "\n"
+        finally:
+            # Client went away or an answer failed: stop the remaining generations
+            for t in tasks:
+                t.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
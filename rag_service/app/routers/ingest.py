@@ -1,24 +1,124 @@
 from __future__ import annotations
 
-from fastapi import APIRouter
+import time
+import uuid
+from typing import List
 
-from ..config import settings
-from ..embeddings import embeddings
+from fastapi import APIRouter, Depends, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from ..dedup import dedupe_chunks
 from ..loaders import load_all
-from ..vectorstore import vs
+from ..parsers import parser_report
+from ..ratelimit import rate_limit
+from ..state import shared_state
+from ..tenants import Tenant, get_tenant, tenants
 
 router = APIRouter(prefix="/ingest", tags=["ingest"])
 
+# A running job whose worker died stops blocking new runs after this long
+_RUNNING_JOB_TTL = 6 * 3600
+
+
+def _job_key(tenant: Tenant) -> str:
+    return f"ingest:{tenant.name}"
+
+
+def claim_job(tenant: Tenant, kind: str = "ingest") -> dict:
+    """Claim the tenant's ingest slot atomically across workers (ingests and snapshot loads)."""
+    job_id = uuid.uuid4().hex
+    new_job = {"id": job_id, "kind": kind, "status": "running", "started_at": time.time()}
+    job = shared_state.update(
+        _job_key(tenant),
+        lambda cur: cur if cur and cur.get("status") == "running" else new_job,
+        ttl=_RUNNING_JOB_TTL,
+    )
+    if job["id"] != job_id:
+        running = job.get("kind", "ingest")
+        raise HTTPException(status_code=409, detail=f"{running.capitalize()} already running for tenant {tenant.name}")
+    return job
+
+
+def finish_job(tenant: Tenant, job: dict, status: str, **fields) -> None:
+    shared_state.set(_job_key(tenant), {**job, "status": status, **fields, "finished_at": time.time()})
+
+
+@router.post("/run", dependencies=[Depends(rate_limit("ingest"))])
+async def run_ingest(tenant: Tenant = Depends(get_tenant)):
+    job = claim_job(tenant)
+    try:
+        # Parsing, embedding and upserts block; keep them off the event loop
+        indexed = await run_in_threadpool(_ingest, tenant)
+    except Exception as e:
+        finish_job(tenant, job, "error", error=str(e))
+        raise
+    finish_job(tenant, job, "completed", indexed=indexed)
+    return {"status": "ok", "indexed": indexed}
 
-@router.post("/run")
-async def run_ingest():
-    docs = load_all(settings.docs_dir)
+
+def _ingest(tenant: Tenant) -> int:
+    cfg = tenant.settings
+    # Another tenant's docs_dir may be configured inside this one's; don't index its files here
+    docs = load_all(cfg.docs_dir, cfg, exclude=tenants.nested_roots(tenant))
     if not docs:
-        return {"status": "ok", "indexed": 0}
+        return 0
+    dropped: List[int] = []
+    if cfg.dedup:
+        docs, dropped = dedupe_chunks(docs, cfg.dedup_max_distance)
     texts = [d["text"] for d in docs]
-    vecs = embeddings.embed(texts)
+    vecs = tenant.embeddings.embed(texts)
     ids = [d["id"] for d in docs]
-    # Include text in payload for easier retrieval context
-    payloads = [{**d["metadata"], "text": d["text"]} for d in docs]
-    vs.upsert(ids, vecs, payloads)
-    return {"status": "ok", "indexed": len(ids)}
+    # Text lives in the local chunk store; Qdrant keeps ids and small metadata
+    tenant.chunk_store.put_many(ids, texts)
+    # Parent sections are only stored for small-to-big expansion, never embedded
+    parents = {d["metadata"]["parent_id"]: d["parent_text"] for d in docs if "parent_text" in d}
+    if parents:
+        tenant.chunk_store.put_many(list(parents), list(parents.values()))
+    payloads = [d["metadata"] for d in docs]
+    tenant.vs.upsert(ids, vecs, payloads)
+    if cfg.dedup:
+        _remove_stale_copies(tenant, docs, dropped)
+    return len(ids)
+
+
+def _remove_stale_copies(tenant: Tenant, docs: List[dict], dropped: List[int]) -> None:
+    """Delete points an earlier ingest stored for content that is now a duplicate."""
+    kept_ids = {d["id"] for d in docs}
+    primary = {d["metadata"]["source"] for d in docs}
+    # Copies that no longer own any point of their own
+    copies = {s for d in docs for s in d["metadata"].get("sources", ()) if s not in primary}
+    stale = {i for i in dropped if i not in kept_ids}
+    stale.update(i for i in tenant.vs.ids_for_sources(sorted(copies)) if i not in kept_ids)
+    if stale:
+        tenant.vs.delete(sorted(stale))
+        tenant.chunk_store.delete_many(stale)
+        print(f"Removed {len(stale)} duplicate points from {tenant.vs.collection}")
+
+
+@router.get("/status")
+async def ingest_status(tenant: Tenant = Depends(get_tenant)):
+    """Last or current ingest job of the tenant, as seen by any worker."""
+    return shared_state.get(_job_key(tenant)) or {"status": "idle"}
+
+
+@router.get("/parsers")
+async def list_parsers():
+    """Registered document parsers and their throughput over all ingests."""
+    return {"parsers": parser_report()}
+
+
+@router.post("/migrate-storage")
+async def migrate_storage(tenant: Tenant = Depends(get_tenant)):
+    """Apply the configured quantization/HNSW/on-disk settings to the existing collection."""
+    # Holds the ingest slot: a datatype change drops and recreates the collection
+    job = claim_job(tenant, "storage migration")
+    status, fields = "error", {}
+    try:
+        result = await run_in_threadpool(lambda: tenant.vs.migrate_storage())
+        status, fields = "completed", {"action": result["action"]}
+    except Exception as e:
+        fields = {"error": str(e)}
+        raise
+    finally:
+        finish_job(tenant, job, status, **fields)
+    return {"status": "ok", **result}
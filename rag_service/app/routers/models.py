@@ -2,14 +2,18 @@ from __future__ import annotations
 
 import asyncio
 import json
-from typing import List, Dict, Optional
+from typing import List, Optional
 
 import httpx
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Query
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
+from sse_starlette.sse import EventSourceResponse
 
+from ..catalog import catalog, installed_models, installed_names, invalidate_installed
 from ..config import settings
-from ..llm import ollama
+from ..downloads import ACTIVE, downloads, load_status, load_statuses
+from ..state import store_active_model
+from ..warmpool import warm_pool
 
 router = APIRouter(prefix="/models", tags=["models"])
 
@@ -37,362 +41,107 @@ class ModelSearchRequest(BaseModel):
     limit: int = 20
 
 
-class ModelDownloadStatus(BaseModel):
-    model_name: str
-    status: str  # downloading, completed, error
-    progress: Optional[str] = None
-    error: Optional[str] = None
-
-
-# Store download statuses
-download_statuses: Dict[str, ModelDownloadStatus] = {}
+def _with_status(entries: List[dict], installed: set) -> List[ModelInfo]:
+    download_statuses = load_statuses()
+    result = []
+    for entry in entries:
+        model_info = ModelInfo(**{k: v for k, v in entry.items() if k in ModelInfo.model_fields})
+        model_info.status = "installed" if entry["name"] in installed else "available"
+        # Check if currently downloading
+        status = download_statuses.get(entry["name"])
+        if status is not None and status.status in ACTIVE:
+            model_info.status = "downloading"
+        result.append(model_info)
+    return result
 
 
 @router.get("/search")
 async def search_models(q: str = Query(..., description="Search query for models"), 
                        limit: int = Query(20, description="Maximum number of results")):
-    """Search for models in the Ollama library"""
-    try:
-        # Search Ollama library using their search API
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # Note: This uses the Ollama library search API
-            # If this doesn't work, we'll fall back to a local search
-            search_url = f"https://ollama.com/api/search"
-            params = {"q": q, "limit": limit}
-            
-            try:
-                r = await client.get(search_url, params=params)
-                r.raise_for_status()
-                data = r.json()
-                
-                # Process the search results
-                models = []
-                for model_data in data.get("models", []):
-                    model_info = ModelInfo(
-                        name=model_data.get("name", ""),
-                        description=model_data.get("description", ""),
-                        tags=model_data.get("tags", []),
-                        is_official=model_data.get("is_official", False),
-                        pulls=model_data.get("pulls", 0),
-                        updated_at=model_data.get("updated_at"),
-                        status="available"
-                    )
-                    models.append(model_info)
-                
-                # Check which ones are installed
-                installed_models = await get_installed_models()
-                installed_names = {m.name for m in installed_models}
-                
-                for model in models:
-                    if model.name in installed_names:
-                        model.status = "installed"
-                    elif model.name in download_statuses:
-                        status = download_statuses[model.name]
-                        model.status = status.status
-                
-                return models
-                
-            except Exception as e:
-                # Fallback: search our curated list + installed models
-                return await fallback_search(q, limit)
-                
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
-
-
-async def fallback_search(query: str, limit: int) -> List[ModelInfo]:
-    """Fallback search in curated models + installed models when API search fails"""
-    query_lower = query.lower()
-    
-    # Extended curated list with more models including DeepSeek
-    all_models = [
-        {
-            "name": "llama3.2:3b",
-            "description": "Latest Llama 3.2 model, 3B parameters - good balance of speed and quality",
-            "family": "llama",
-            "parameter_size": "3B",
-            "size": "~2GB"
-        },
-        {
-            "name": "llama3.2:1b",
-            "description": "Smallest Llama 3.2 model, 1B parameters - fastest option",
-            "family": "llama", 
-            "parameter_size": "1B",
-            "size": "~1GB"
-        },
-        {
-            "name": "llama3.1:8b",
-            "description": "Llama 3.1 - 8B parameters, high quality responses",
-            "family": "llama",
-            "parameter_size": "8B",
-            "size": "~4.9GB"
-        },
-        {
-            "name": "phi3:mini",
-            "description": "Microsoft Phi-3 Mini - efficient and fast for chat",
-            "family": "phi3",
-            "parameter_size": "3.8B",
-            "size": "~2.2GB"
-        },
-        {
-            "name": "gemma2:2b",
-            "description": "Google Gemma 2 - 2B parameters, optimized for efficiency",
-            "family": "gemma2",
-            "parameter_size": "2B", 
-            "size": "~1.6GB"
-        },
-        {
-            "name": "qwen2:1.5b",
-            "description": "Qwen 2 - 1.5B parameters, multilingual support",
-            "family": "qwen2",
-            "parameter_size": "1.5B",
-            "size": "~934MB"
-        },
-        {
-            "name": "qwen2:7b",
-            "description": "Qwen 2 - 7B parameters, larger multilingual model",
-            "family": "qwen2",
-            "parameter_size": "7B",
-            "size": "~4.4GB"
-        },
-        {
-            "name": "deepseek-r1:latest",
-            "description": "DeepSeek R1 - Advanced reasoning model with chain of thought",
-            "family": "deepseek",
-            "parameter_size": "Unknown",
-            "size": "~Variable",
-            "tags": ["reasoning", "chain-of-thought"]
-        },
-        {
-            "name": "deepseek-r1:1.5b",
-            "description": "DeepSeek R1 - 1.5B parameters, compact reasoning model",
-            "family": "deepseek",
-            "parameter_size": "1.5B",
-            "size": "~1.5GB",
-            "tags": ["reasoning", "small"]
-        },
-        {
-            "name": "deepseek-r1:7b",
-            "description": "DeepSeek R1 - 7B parameters, powerful reasoning capabilities",
-            "family": "deepseek", 
-            "parameter_size": "7B",
-            "size": "~4.3GB",
-            "tags": ["reasoning", "large"]
-        },
-        {
-            "name": "deepseek-coder:1.3b",
-            "description": "DeepSeek Coder - Specialized for code generation and understanding",
-            "family": "deepseek",
-            "parameter_size": "1.3B",
-            "size": "~1.3GB",
-            "tags": ["coding", "programming"]
-        },
-        {
-            "name": "codellama:7b",
-            "description": "Code Llama - Meta's code-specialized language model",
-            "family": "llama",
-            "parameter_size": "7B", 
-            "size": "~3.8GB",
-            "tags": ["coding", "programming"]
-        },
-        {
-            "name": "mistral:7b",
-            "description": "Mistral 7B - Efficient and powerful general-purpose model",
-            "family": "mistral",
-            "parameter_size": "7B",
-            "size": "~4.1GB"
-        },
-        {
-            "name": "neural-chat:7b",
-            "description": "Intel's neural chat model optimized for conversations",
-            "family": "neural-chat",
-            "parameter_size": "7B",
-            "size": "~4.1GB",
-            "tags": ["chat", "conversation"]
-        }
-    ]
-    
-    # Filter models based on query
-    filtered_models = []
-    for model in all_models:
-        if (query_lower in model["name"].lower() or 
-            query_lower in model.get("description", "").lower() or
-            query_lower in model.get("family", "").lower() or
-            any(query_lower in tag for tag in model.get("tags", []))):
-            filtered_models.append(model)
-    
-    # Get installed models to check status
-    try:
-        installed_models = await get_installed_models()
-        installed_names = {m.name for m in installed_models}
-    except:
-        installed_names = set()
-    
-    # Convert to ModelInfo objects
-    result = []
-    for model in filtered_models[:limit]:
-        model_info = ModelInfo(
-            name=model["name"],
-            description=model["description"],
-            family=model["family"],
-            parameter_size=model["parameter_size"],
-            size=model["size"],
-            tags=model.get("tags"),
-            status="installed" if model["name"] in installed_names else "available"
-        )
-        
-        # Check if currently downloading
-        if model["name"] in download_statuses:
-            status = download_statuses[model["name"]]
-            model_info.status = status.status
-            
-        result.append(model_info)
-    
-    return result
+    """Search the local model catalog; ollama.com results are merged in the background"""
+    catalog.refresh(q)
+    return _with_status(catalog.search(q, limit), await installed_names())
 
 
 @router.get("/available", response_model=List[ModelInfo])
 async def get_available_models():
     """Get list of popular available models from Ollama library"""
-    # Popular models that work well for RAG
-    popular_models = [
-        {
-            "name": "llama3.2:3b",
-            "description": "Latest Llama 3.2 model, 3B parameters - good balance of speed and quality",
-            "family": "llama",
-            "parameter_size": "3B",
-            "size": "~2GB"
-        },
-        {
-            "name": "llama3.2:1b",
-            "description": "Smallest Llama 3.2 model, 1B parameters - fastest option",
-            "family": "llama", 
-            "parameter_size": "1B",
-            "size": "~1GB"
-        },
-        {
-            "name": "phi3:mini",
-            "description": "Microsoft Phi-3 Mini - efficient and fast for chat",
-            "family": "phi3",
-            "parameter_size": "3.8B",
-            "size": "~2.2GB"
-        },
-        {
-            "name": "gemma2:2b",
-            "description": "Google Gemma 2 - 2B parameters, optimized for efficiency",
-            "family": "gemma2",
-            "parameter_size": "2B", 
-            "size": "~1.6GB"
-        },
-        {
-            "name": "qwen2:1.5b",
-            "description": "Qwen 2 - 1.5B parameters, multilingual support",
-            "family": "qwen2",
-            "parameter_size": "1.5B",
-            "size": "~934MB"
-        },
-        {
-            "name": "llama3.1:8b",
-            "description": "Llama 3.1 - 8B parameters, high quality responses",
-            "family": "llama",
-            "parameter_size": "8B",
-            "size": "~4.9GB"
-        }
-    ]
-    
-    # Get currently installed models
-    try:
-        installed_models = await get_installed_models()
-        installed_names = {m.name for m in installed_models}
-        
-        result = []
-        for model in popular_models:
-            model_info = ModelInfo(
-                name=model["name"],
-                description=model["description"],
-                family=model["family"],
-                parameter_size=model["parameter_size"],
-                size=model["size"],
-                status="installed" if model["name"] in installed_names else "available"
-            )
-            
-            # Check if currently downloading
-            if model["name"] in download_statuses:
-                status = download_statuses[model["name"]]
-                model_info.status = status.status
-                
-            result.append(model_info)
-            
-        return result
-        
-    except Exception as e:
-        # Fallback to basic list if Ollama is not available
-        return [ModelInfo(**model, status="available") for model in popular_models]
+    return _with_status(catalog.popular(), await installed_names())
 
 
 @router.get("/installed", response_model=List[ModelInfo])
-async def get_installed_models():
+async def get_installed_models(refresh: bool = False):
     """Get list of currently installed models"""
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            r = await client.get(f"{settings.llm_base_url}/api/tags")
-            r.raise_for_status()
-            data = r.json()
-            
-            models = []
-            for model in data.get("models", []):
-                details = model.get("details", {})
-                models.append(ModelInfo(
-                    name=model["name"],
-                    size=f"{model.get('size', 0) / (1024*1024*1024):.1f}GB" if model.get('size') else None,
-                    modified_at=model.get("modified_at"),
-                    status="installed",
-                    family=details.get("family"),
-                    parameter_size=details.get("parameter_size")
-                ))
-                
-            return models
+        models = []
+        for model in await installed_models(refresh=refresh):
+            details = model.get("details", {})
+            models.append(ModelInfo(
+                name=model["name"],
+                size=f"{model.get('size', 0) / (1024*1024*1024):.1f}GB" if model.get('size') else None,
+                modified_at=model.get("modified_at"),
+                status="installed",
+                family=details.get("family"),
+                parameter_size=details.get("parameter_size")
+            ))
+        return models
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get installed models: {str(e)}")
 
 
 @router.post("/download")
-async def download_model(request: ModelDownloadRequest, background_tasks: BackgroundTasks):
+async def download_model(request: ModelDownloadRequest):
     """Start downloading a model in the background"""
     model_name = request.model_name
-    
-    # Check if already downloading
-    if model_name in download_statuses:
-        status = download_statuses[model_name]
-        if status.status == "downloading":
-            return {"message": f"Model {model_name} is already downloading", "status": status}
-    
-    # Initialize download status
-    download_statuses[model_name] = ModelDownloadStatus(
-        model_name=model_name,
-        status="downloading",
-        progress="Starting download..."
-    )
-    
-    # Start download in background
-    background_tasks.add_task(download_model_task, model_name)
-    
+    status, started = downloads.start(model_name)
+    if not started:
+        return {"message": f"Model {model_name} is already downloading", "status": status}
     return {
         "message": f"Started downloading {model_name}",
-        "status": download_statuses[model_name]
+        "status": status
     }
 
 
-@router.get("/download/status/{model_name}")
+@router.get("/download/status/{model_name:path}")
 async def get_download_status(model_name: str):
     """Get download status for a specific model"""
-    if model_name in download_statuses:
-        return download_statuses[model_name]
+    status = load_status(model_name)
+    if status is not None:
+        return status
     else:
         return {"model_name": model_name, "status": "not_found", "error": "No download in progress"}
 
 
+@router.get("/download/events/{model_name:path}")
+async def download_events(model_name: str):
+    """Server-sent 'progress' events while the download is active, then a final 'done'."""
+
+    async def events():
+        last = None
+        while True:
+            # The pull may run in another worker; its progress reaches us through shared state
+            status = load_status(model_name)
+            data = status.model_dump_json() if status else json.dumps({"model_name": model_name, "status": "not_found"})
+            if data != last:
+                yield {"event": "progress", "data": data}
+                last = data
+            if status is None or status.status not in ACTIVE:
+                yield {"event": "done", "data": data}
+                return
+            await asyncio.sleep(0.5)
+
+    return EventSourceResponse(events(), ping=settings.sse_ping_seconds)
+
+
+@router.post("/download/cancel/{model_name:path}")
+async def cancel_download(model_name: str):
+    status = await downloads.cancel(model_name)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"No download of {model_name}")
+    return status
+
+
 @router.post("/set-active")
 async def set_active_model(request: ModelDownloadRequest):
     """Set the active model for chat"""
@@ -400,18 +149,26 @@ async def set_active_model(request: ModelDownloadRequest):
     
     # Verify model is installed
     try:
-        installed = await get_installed_models()
-        installed_names = {m.name for m in installed}
-        
-        if model_name not in installed_names:
+        names = {m.get("name") for m in await installed_models()}
+        if model_name not in names:
+            # The cache may predate a pull that just finished
+            names = {m.get("name") for m in await installed_models(refresh=True)}
+        if model_name not in names:
             raise HTTPException(status_code=400, detail=f"Model {model_name} is not installed")
         
-        # Update configuration (in production, this would update the config file)
-        settings.llm_model = model_name
+        # Load it before switching so the first chat doesn't pay the cold start
+        try:
+            preload = await warm_pool.preload(model_name)
+        except Exception as e:
+            preload = {"model": model_name, "error": str(e)}
+
+        # Shared across workers; the configured llm_model stays the default
+        store_active_model(model_name)
         
         return {
             "message": f"Active model set to {model_name}",
-            "model": model_name
+            "model": model_name,
+            "preload": preload,
         }
         
     except HTTPException:
@@ -420,21 +177,10 @@ async def set_active_model(request: ModelDownloadRequest):
         raise HTTPException(status_code=500, detail=f"Failed to set active model: {str(e)}")
 
 
-async def download_model_task(model_name: str):
-    """Background task to download a model"""
-    try:
-        download_statuses[model_name].progress = "Connecting to Ollama..."
-        
-        # Use ollama client to pull the model
-        await ollama.ensure_model(model_name)
-        
-        download_statuses[model_name].status = "completed"
-        download_statuses[model_name].progress = "Download completed successfully"
-        
-    except Exception as e:
-        download_statuses[model_name].status = "error"
-        download_statuses[model_name].error = str(e)
-        download_statuses[model_name].progress = f"Download failed: {str(e)}"
+@router.get("/warm")
+async def warm_status():
+    """Models kept warm, what Ollama has loaded, and recorded load times."""
+    return await warm_pool.report()
 
 
 @router.delete("/remove/{model_name}")
@@ -444,6 +190,7 @@ async def remove_model(model_name: str):
         async with httpx.AsyncClient(timeout=30.0) as client:
             r = await client.delete(f"{settings.llm_base_url}/api/delete", json={"name": model_name})
             r.raise_for_status()
+        invalidate_installed()
             
         return {"message": f"Model {model_name} removed successfully"}
         
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..ratelimit import limiter
+from ..retrieval import Diversity, Hit, SearchFilters, retrieve_batch
+from ..tenants import Tenant, get_tenant
+from ..warmup import require_ready
+
+router = APIRouter(prefix="/retrieve", tags=["retrieve"])
+
+
+class BatchQuery(BaseModel):
+    query: str
+    id: str | None = None  # echoed back to correlate results
+    filters: SearchFilters | None = None  # overrides the request-level filters
+
+
+class BatchRequest(BaseModel):
+    queries: List[BatchQuery]
+    top_k: int | None = None
+    filters: SearchFilters | None = None
+    expand: bool = False  # return parent sections instead of the matching chunks
+    diversity: Diversity | None = None
+
+
+def hit_to_dict(hit: Hit) -> dict:
+    return {
+        "id": hit.id,
+        "score": hit.score,
+        "source": hit.source,
+        # Every path holding this content, when duplicates were merged at ingest
+        "sources": hit.payload.get("sources") or [hit.source],
+        "page": hit.payload.get("page"),
+        "text": hit.text,
+    }
+
+
+async def run_batch(req: BatchRequest, tenant: Tenant) -> List[List[Hit]]:
+    if len(req.queries) > settings.batch_max_queries:
+        raise HTTPException(status_code=413, detail=f"At most {settings.batch_max_queries} queries per batch")
+    # Embedding hundreds of queries is CPU-bound; keep it off the event loop
+    return await run_in_threadpool(
+        retrieve_batch,
+        tenant,
+        [q.query.strip() for q in req.queries],
+        req.top_k,
+        [q.filters or req.filters for q in req.queries],
+        req.expand,
+        req.diversity,
+    )
+
+
+@router.post("/batch", dependencies=[Depends(require_ready)])
+async def retrieve_many(req: BatchRequest, request: Request, tenant: Tenant = Depends(get_tenant)):
+    """Retrieval only for many queries, with one embedding call and one Qdrant batch search."""
+    limiter.check(request, "retrieval", cost=len(req.queries))
+    results = await run_batch(req, tenant)
+    return {
+        "results": [
+            {"id": q.id, "query": q.query, "hits": [hit_to_dict(h) for h in hits]}
+            for q, hits in zip(req.queries, results)
+        ]
+    }
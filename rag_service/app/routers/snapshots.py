@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from ..ratelimit import rate_limit
+from ..snapshots import SUFFIX, export_snapshot, import_snapshot, list_snapshots, snapshot_dir
+from ..tenants import Tenant, get_tenant
+from .ingest import claim_job, finish_job
+
+router = APIRouter(prefix="/snapshots", tags=["snapshots"])
+
+
+class ImportRequest(BaseModel):
+    name: str  # file in the snapshot directory, e.g. downloaded from another node
+    replace: bool = True
+
+
+def _snapshot_path(name: str) -> Path:
+    path = snapshot_dir() / Path(name).name
+    if path.suffix != SUFFIX or not path.is_file():
+        raise HTTPException(status_code=404, detail=f"No snapshot named {name}")
+    return path
+
+
+@router.get("")
+async def get_snapshots():
+    return {"snapshots": list_snapshots()}
+
+
+@router.post("/export", dependencies=[Depends(rate_limit("ingest"))])
+async def export(tenant: Tenant = Depends(get_tenant)):
+    # Holding the ingest slot keeps the collection from changing mid-export
+    job = claim_job(tenant, "snapshot export")
+    try:
+        result = await run_in_threadpool(export_snapshot, tenant)
+    except Exception as e:
+        finish_job(tenant, job, "error", error=str(e))
+        raise
+    finish_job(tenant, job, "completed", snapshot=result["path"])
+    return result
+
+
+@router.post("/import", dependencies=[Depends(rate_limit("ingest"))])
+async def import_(req: ImportRequest, tenant: Tenant = Depends(get_tenant)):
+    path = _snapshot_path(req.name)
+    job = claim_job(tenant, "snapshot import")
+    try:
+        result = await run_in_threadpool(import_snapshot, tenant, path, req.replace)
+    except ValueError as e:
+        finish_job(tenant, job, "error", error=str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        finish_job(tenant, job, "error", error=str(e))
+        raise
+    finish_job(tenant, job, "completed", indexed=result["points"], snapshot=str(path))
+    return result
+
+
+@router.get("/{name}")
+async def download(name: str):
+    """The snapshot file, for bootstrapping another node."""
+    path = _snapshot_path(name)
+    return FileResponse(path, media_type="application/octet-stream", filename=path.name)
@@ -1,29 +1,54 @@
 from __future__ import annotations
 
-from fastapi import APIRouter
-import httpx
+from fastapi import APIRouter, Depends
+from starlette.concurrency import run_in_threadpool
 
-from ..config import settings
-from ..vectorstore import vs
+from ..catalog import installed_models
+from ..embeddings import embedding_pool
+from ..state import get_active_model
+from ..tenants import Tenant, get_tenant, tenants
+from ..warmup import readiness
 
 router = APIRouter(prefix="/status", tags=["status"])
 
 
 @router.get("")
-async def get_status():
+async def get_status(tenant: Tenant = Depends(get_tenant)):
     # Check Ollama model availability
     model_available = False
     tags = []
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            r = await client.get(f"{settings.llm_base_url.rstrip('/')}/api/tags")
-            r.raise_for_status()
-            tags = [m.get("name") for m in r.json().get("models", [])]
-            model_available = settings.llm_model in tags
+        tags = [m.get("name") for m in await installed_models()]
+        model_available = get_active_model() in tags
     except Exception:
         pass
 
-    # Check Qdrant points count
+    index = {"points": None, "chunks_stored": None}
+    if readiness.ready:
+        # Qdrant and the chunk store block; keep them off the event loop
+        index = await run_in_threadpool(_index_stats, tenant)
+
+    return {
+        "status": "ready" if readiness.ready else "warming",
+        "llm_model": get_active_model(),
+        "model_available": model_available,
+        "available_models": tags,
+        "qdrant_collection": tenant.settings.qdrant_collection,
+        **index,
+        "docs_dir": str(tenant.settings.docs_dir),
+        "tenant": tenant.name,
+        "tenants": tenants.names(),
+        "embedding_model": tenant.settings.embedding_model,
+        "embedding_models_loaded": embedding_pool.loaded(),
+    }
+
+
+def _index_stats(tenant: Tenant) -> dict:
+    """Points and stored chunks; until warm-up has opened the stores /status leaves them out."""
+    try:
+        vs = tenant.vs
+    except Exception as e:
+        return {"points": None, "chunks_stored": None, "qdrant_error": str(e)}
     points = None
     try:
         cnt = vs.client.count(collection_name=vs.collection, exact=True)
@@ -35,12 +60,4 @@ async def get_status():
             points = int(getattr(info, "points_count", 0) or 0)
         except Exception:
             points = None
-
-    return {
-        "llm_model": settings.llm_model,
-        "model_available": model_available,
-        "available_models": tags,
-        "qdrant_collection": vs.collection,
-        "points": points,
-        "docs_dir": str(settings.docs_dir),
-    }
+    return {"points": points, "chunks_stored": tenant.chunk_store.count()}
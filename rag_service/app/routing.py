@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from .config import Settings
+from .metrics import metrics
+from .retrieval import Hit
+from .state import get_active_model
+
+
+# Wording that asks for synthesis across passages rather than a lookup
+_SYNTHESIS = re.compile(
+    r"\b(compare|comparison|differen\w*|versus|vs|summari[sz]e|summary|overview|explain|why|"
+    r"pros|cons|trade-?offs?|analy[sz]e|implications?|list all|all of)\b",
+    re.IGNORECASE,
+)
+ROUTES = ("extractive", "small", "large")
+
+
+@dataclass
+class Route:
+    name: str  # extractive | small | large
+    model: str
+    reason: str
+    features: Dict[str, float] = field(default_factory=dict)
+
+
+def query_features(query: str, hits: List[Hit]) -> Dict[str, float]:
+    scores = sorted((h.score for h in hits), reverse=True)
+    return {
+        "words": len(query.split()),
+        "synthesis": bool(_SYNTHESIS.search(query)),
+        "top_score": round(scores[0], 4) if scores else 0.0,
+        # How clearly the best passage beats the runner-up
+        "gap": round(scores[0] - scores[1], 4) if len(scores) > 1 else 1.0,
+        "sources": len({h.source for h in hits if h.source}),
+    }
+
+
+def route_query(query: str, hits: List[Hit], cfg: Settings, force: Optional[str] = None) -> Route:
+    """Send simple lookups to llm_small_model and everything else to the active model.
+
+    A query is simple when it is short, has no synthesis wording, and retrieval
+    found a confident answer that is either in one source or clearly ahead of the rest.
+    """
+    large = get_active_model()
+    small = cfg.llm_small_model
+    features = query_features(query, hits)
+    if not small or small == large:
+        return Route("large", large, "no small model configured", features)
+    if force in ("small", "large"):
+        return Route(force, small if force == "small" else large, "requested", features)
+
+    reasons = []
+    if features["words"] > cfg.route_max_words:
+        reasons.append("long query")
+    if features["synthesis"]:
+        reasons.append("synthesis wording")
+    if features["top_score"] < cfg.route_min_score:
+        reasons.append("weak retrieval")
+    if features["sources"] > cfg.route_max_sources and features["gap"] < cfg.route_min_gap:
+        reasons.append("answer spread over sources")
+    if reasons:
+        return Route("large", large, ", ".join(reasons), features)
+    return Route("small", small, "simple lookup", features)
+
+
+# Answered from the retrieved sentences, without a model
+EXTRACTIVE = Route("extractive", "", "confident retrieval")
+
+
+def record_route(route: Route, seconds: float) -> None:
+    metrics.add_many({f"route.{route.name}.requests": 1, f"route.{route.name}.seconds": round(seconds, 3)})
+
+
+def route_stats() -> Dict[str, dict]:
+    snapshot = metrics.snapshot()
+    out = {}
+    for name in ROUTES:
+        requests = snapshot.get(f"route.{name}.requests", 0)
+        seconds = snapshot.get(f"route.{name}.seconds", 0.0)
+        out[name] = {
+            "requests": requests,
+            "avg_seconds": round(seconds / requests, 3) if requests else None,
+        }
+    return out
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import re
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from .chunking import approx_token_counts
+from .config import Settings, settings
+from .metrics import metrics
+from .state import StateBackend, shared_state
+
+
+# Short questions leaning on the previous turn: "and for contractors?", "what about it"
+_FOLLOW_UP = re.compile(
+    r"^(and|also|or|but|so|then|what about|how about)\b|\b(it|its|that|this|those|these|they|them|their|there)\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class SessionTurn:
+    """A chat turn in progress: what to search for and what to send to Ollama."""
+
+    tenant: str
+    session_id: str
+    model: str
+    search_query: str
+    history: List[Dict[str, str]] = field(default_factory=list)
+    seq: int = 0  # turns answered so far; unlike len(history) it keeps growing after trimming
+    # Ollama context of the previous turn; when set, history is already in it
+    context: Optional[List[int]] = None
+
+
+class ContextCache:
+    """Per-worker LRU of Ollama context token arrays, capped by memory."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items: "OrderedDict[str, Tuple[int, str, array]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, seq: int, model: str) -> Optional[List[int]]:
+        with self._lock:
+            entry = self._items.get(key)
+            # Another worker may have answered a turn since; then the context is stale
+            if entry is None or entry[0] != seq or entry[1] != model:
+                return None
+            self._items.move_to_end(key)
+            return entry[2].tolist()
+
+    def put(self, key: str, seq: int, model: str, context: List[int]) -> None:
+        tokens = array("l", context)
+        size = tokens.itemsize * len(tokens)
+        with self._lock:
+            self._drop(key)
+            if size > self.max_bytes:
+                return
+            self._items[key] = (seq, model, tokens)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._items)))
+
+    def pop(self, key: str) -> None:
+        with self._lock:
+            self._drop(key)
+
+    def _drop(self, key: str) -> None:
+        entry = self._items.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2].itemsize * len(entry[2])
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class SessionStore:
+    """Chat sessions: bounded history in shared state, so any worker can continue one."""
+
+    def __init__(self, state: StateBackend = shared_state, cfg: Settings = settings):
+        self.state = state
+        self.cfg = cfg
+        self.contexts = ContextCache(cfg.session_cache_mb * 1024 * 1024)
+
+    @staticmethod
+    def _key(tenant: str, session_id: str) -> str:
+        return f"session:{tenant}:{session_id}"
+
+    def create(self, tenant: str) -> str:
+        session_id = uuid.uuid4().hex
+        self.state.set(
+            self._key(tenant, session_id), {"turns": [], "seq": 0, "updated": time.time()}, ttl=self.cfg.session_ttl
+        )
+        return session_id
+
+    def history(self, tenant: str, session_id: str) -> Optional[List[Dict[str, str]]]:
+        data = self.state.get(self._key(tenant, session_id))
+        return None if data is None else data["turns"]
+
+    def delete(self, tenant: str, session_id: str) -> None:
+        self.state.delete(self._key(tenant, session_id))
+        self.contexts.pop(self._key(tenant, session_id))
+
+    def begin(self, tenant: str, session_id: str, query: str, model: str) -> SessionTurn:
+        """Prepare a turn; unknown or expired ids start an empty session under that id."""
+        data = self.state.get(self._key(tenant, session_id)) or {"turns": []}
+        turns = data["turns"]
+        turn = SessionTurn(
+            tenant=tenant,
+            session_id=session_id,
+            model=model,
+            search_query=self.rewrite(query, turns),
+            history=turns,
+            seq=data.get("seq", len(turns)),
+        )
+        self.use_model(turn, model)
+        return turn
+
+    def use_model(self, turn: SessionTurn, model: str) -> None:
+        """Answer the turn with this model; Ollama contexts only carry over within one model."""
+        turn.model = model
+        turn.context = self.contexts.get(self._key(turn.tenant, turn.session_id), turn.seq, model)
+
+    def keep_context(self, turn: SessionTurn, prompt: str, answer_tokens: int) -> bool:
+        """Whether the previous context, this prompt and the answer fit in num_ctx.
+
+        Otherwise the context is dropped and the turn starts over from the
+        trimmed text history.
+        """
+        if turn.context is None:
+            return False
+        room = self.cfg.llm_num_ctx - approx_token_counts([prompt])[0] - answer_tokens
+        if len(turn.context) <= room:
+            metrics.incr("session.context.reused")
+            return True
+        metrics.incr("session.context.dropped")
+        turn.context = None
+        return False
+
+    def finish(self, turn: SessionTurn, question: str, answer: str, context: Optional[List[int]]) -> None:
+        key = self._key(turn.tenant, turn.session_id)
+
+        def append(data):
+            data = data or {"turns": []}
+            turns = data["turns"] + [{"user": question, "assistant": answer}]
+            seq = data.get("seq", len(data["turns"])) + 1
+            return {"turns": self.trim(turns), "seq": seq, "updated": time.time()}
+
+        data = self.state.update(key, append, ttl=self.cfg.session_ttl)
+        if context:
+            self.contexts.put(key, data["seq"], turn.model, context)
+        else:
+            self.contexts.pop(key)
+
+    def trim(self, turns: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Keep the newest turns within session_max_turns and session_max_tokens."""
+        turns = turns[-self.cfg.session_max_turns:]
+        sizes = approx_token_counts([t["user"] + " " + t["assistant"] for t in turns])
+        total = sum(sizes)
+        start = 0
+        while start < len(turns) - 1 and total > self.cfg.session_max_tokens:
+            total -= sizes[start]
+            start += 1
+        return turns[start:]
+
+    def rewrite(self, query: str, turns: List[Dict[str, str]]) -> str:
+        """Search query for a follow-up: prepend the previous question when this one depends on it."""
+        if not turns or not self.cfg.session_rewrite:
+            return query
+        if len(query.split()) <= 3 or _FOLLOW_UP.search(query):
+            return f"{turns[-1]['user']} {query}"
+        return query
+
+
+sessions = SessionStore()
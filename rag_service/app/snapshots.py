@@ -0,0 +1,298 @@
+"""Index snapshots: one file with everything a node needs to serve a tenant.
+
+A snapshot holds the vectors, payloads and chunk text of a tenant's collection
+plus a manifest of the indexed files and the settings they were indexed with.
+A new node imports it instead of parsing and embedding the docs share again.
+
+Layout (little endian):
+
+    "RAGSNAP\\0" | u32 format version | padding to 64 bytes
+    vectors   float32 [points, dim], 64-byte aligned, memory-mappable
+    ids       int64 [points], memory-mappable
+    payloads  frames of u32 length + zlib(JSON list), in id order
+    chunks    rows of i64 id + u32 length + zlib(text), as stored by ChunkStore
+    footer    zlib(JSON: format, manifest, section offsets)
+    u64 footer offset | "RAGSNAP\\0"
+
+    python -m app.snapshots export [--tenant hr] [--out file.ragsnap]
+    python -m app.snapshots import file.ragsnap [--tenant hr] [--merge]
+    python -m app.snapshots info file.ragsnap
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import struct
+import tempfile
+import time
+import uuid
+import zlib
+from array import array
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .config import settings
+from .tenants import Tenant, tenants
+
+
+MAGIC = b"RAGSNAP\0"
+FORMAT_VERSION = 1
+SUFFIX = ".ragsnap"
+_ALIGN = 64
+_FRAME = struct.Struct("<I")
+_ROW = struct.Struct("<qI")
+_TAIL = struct.Struct("<Q8s")
+# Settings that shape the chunks; an import under different values still works
+# but later ingests will chunk differently from the imported points
+INDEX_KEYS = (
+    "chunker",
+    "chunk_size",
+    "chunk_overlap",
+    "chunk_max_tokens",
+    "chunk_overlap_tokens",
+    "chunk_tokenizer",
+    "parent_max_tokens",
+    "dedup",
+    "dedup_max_distance",
+)
+
+
+def snapshot_dir() -> Path:
+    return settings.data_dir / "snapshots"
+
+
+def _pad(f: BinaryIO) -> None:
+    f.write(b"\0" * (-f.tell() % _ALIGN))
+
+
+def _read(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError(f"{f.name} is truncated")
+    return data
+
+
+def _write_frame(f: BinaryIO, items: list) -> None:
+    data = zlib.compress(json.dumps(items, separators=(",", ":")).encode("utf-8"))
+    f.write(_FRAME.pack(len(data)))
+    f.write(data)
+
+
+def export_snapshot(tenant: Tenant, path: Optional[Path] = None) -> dict:
+    """Write the tenant's index to a snapshot file; returns its manifest and path."""
+    cfg = tenant.settings
+    if path is None:
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = snapshot_dir() / f"{cfg.qdrant_collection}-{stamp}{SUFFIX}"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+    t0 = time.perf_counter()
+    ids = array("q")
+    files: Dict[str, dict] = {}
+    sections: Dict[str, dict] = {}
+    dim = None
+    try:
+        with open(tmp, "wb") as f, tempfile.TemporaryFile(dir=path.parent) as payloads:
+            f.write(MAGIC + struct.pack("<I", FORMAT_VERSION))
+            _pad(f)
+            start = f.tell()
+            # Vectors go straight to the file; payloads to a side file appended after them
+            for batch_ids, vectors, batch_payloads in tenant.vs.scroll_all():
+                block = np.asarray(vectors, dtype=np.float32)
+                dim = block.shape[1]
+                f.write(block.tobytes())
+                ids.extend(batch_ids)
+                _write_frame(payloads, batch_payloads)
+                for p in batch_payloads:
+                    entry = files.setdefault(p.get("source") or "", {"mtime": p.get("mtime"), "chunks": 0})
+                    entry["chunks"] += 1
+            dim = dim or tenant.embeddings.dim
+            sections["vectors"] = {"offset": start, "dtype": "float32", "shape": [len(ids), dim]}
+
+            _pad(f)
+            sections["ids"] = {"offset": f.tell(), "dtype": "int64", "shape": [len(ids)]}
+            f.write(ids.tobytes())
+
+            sections["payloads"] = {"offset": f.tell(), "length": payloads.tell()}
+            payloads.seek(0)
+            while block := payloads.read(1 << 20):
+                f.write(block)
+
+            rows = 0
+            sections["chunks"] = {"offset": f.tell()}
+            for batch in tenant.chunk_store.iter_raw():
+                for row_id, blob in batch:
+                    f.write(_ROW.pack(row_id, len(blob)))
+                    f.write(blob)
+                rows += len(batch)
+            sections["chunks"].update(length=f.tell() - sections["chunks"]["offset"], rows=rows)
+
+            manifest = {
+                "tenant": tenant.name,
+                "collection": cfg.qdrant_collection,
+                "created_at": time.time(),
+                "points": len(ids),
+                "chunks": rows,
+                "embedding_model": cfg.embedding_model,
+                "dim": dim,
+                "distance": "cosine",
+                "index_settings": {k: getattr(cfg, k) for k in INDEX_KEYS},
+                "files": files,
+            }
+            footer_at = f.tell()
+            footer = {"format": FORMAT_VERSION, "manifest": manifest, "sections": sections}
+            f.write(zlib.compress(json.dumps(footer).encode("utf-8")))
+            f.write(_TAIL.pack(footer_at, MAGIC))
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    seconds = round(time.perf_counter() - t0, 2)
+    print(f"Exported {len(ids)} points of {cfg.qdrant_collection} to {path} in {seconds}s")
+    return {"path": str(path), "bytes": path.stat().st_size, "seconds": seconds, **_summary(manifest)}
+
+
+class Snapshot:
+    """Read side of a snapshot file; arrays are memory-mapped, the rest is streamed."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, "rb") as f:
+            head = f.read(len(MAGIC) + 4)
+            if head[: len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a snapshot file")
+            version = struct.unpack("<I", head[len(MAGIC):])[0]
+            if version > FORMAT_VERSION:
+                raise ValueError(f"{path} has snapshot format {version}; this version reads up to {FORMAT_VERSION}")
+            f.seek(-_TAIL.size, os.SEEK_END)
+            footer_at, magic = _TAIL.unpack(f.read(_TAIL.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is truncated")
+            end = f.seek(0, os.SEEK_END) - _TAIL.size
+            f.seek(footer_at)
+            footer = json.loads(zlib.decompress(f.read(end - footer_at)))
+        self.manifest: dict = footer["manifest"]
+        self.sections: Dict[str, dict] = footer["sections"]
+
+    def _array(self, name: str) -> np.ndarray:
+        s = self.sections[name]
+        if not s["shape"][0]:
+            return np.zeros(s["shape"], dtype=s["dtype"])
+        return np.memmap(self.path, dtype=s["dtype"], mode="r", offset=s["offset"], shape=tuple(s["shape"]))
+
+    def vectors(self) -> np.ndarray:
+        return self._array("vectors")
+
+    def ids(self) -> np.ndarray:
+        return self._array("ids")
+
+    def payloads(self) -> Iterator[dict]:
+        s = self.sections["payloads"]
+        with open(self.path, "rb") as f:
+            f.seek(s["offset"])
+            remaining = s["length"]
+            while remaining > 0:
+                (size,) = _FRAME.unpack(_read(f, _FRAME.size))
+                yield from json.loads(zlib.decompress(_read(f, size)))
+                remaining -= _FRAME.size + size
+
+    def chunk_rows(self, batch: int = 1000) -> Iterator[List[Tuple[int, bytes]]]:
+        s = self.sections["chunks"]
+        rows: List[Tuple[int, bytes]] = []
+        with open(self.path, "rb") as f:
+            f.seek(s["offset"])
+            for _ in range(s["rows"]):
+                row_id, size = _ROW.unpack(_read(f, _ROW.size))
+                rows.append((row_id, _read(f, size)))
+                if len(rows) >= batch:
+                    yield rows
+                    rows = []
+        if rows:
+            yield rows
+
+
+def import_snapshot(tenant: Tenant, path: Path, replace: bool = True) -> dict:
+    """Bulk-load a snapshot into the tenant's collection and chunk store.
+
+    With replace the points are staged in a new collection that is published under
+    the collection's name (an alias) only once all of them loaded, so a damaged
+    snapshot leaves the live index as it was; otherwise the snapshot's points are upserted over the existing ones.
+    """
+    cfg = tenant.settings
+    snap = Snapshot(path)
+    m = snap.manifest
+    if m["embedding_model"] != cfg.embedding_model:
+        raise ValueError(
+            f"Snapshot was embedded with {m['embedding_model']}, tenant {tenant.name} uses {cfg.embedding_model}"
+        )
+    if m["dim"] != tenant.embeddings.dim:
+        raise ValueError(f"Snapshot vectors have {m['dim']} dimensions, the embedding model {tenant.embeddings.dim}")
+    changed = {k: v for k, v in m["index_settings"].items() if getattr(cfg, k, v) != v}
+    if changed:
+        print(f"Snapshot was indexed with different settings {changed}; new ingests will chunk differently")
+
+    t0 = time.perf_counter()
+    vs = tenant.vs
+    if not replace:
+        vs.bulk_load((int(i) for i in snap.ids()), snap.vectors(), snap.payloads())
+        for rows in snap.chunk_rows():
+            tenant.chunk_store.put_raw(rows)
+    else:
+        staging = f"{vs.collection}__import_{uuid.uuid4().hex[:12]}"
+        try:
+            vs.recreate(m["dim"], name=staging)
+            vs.bulk_load((int(i) for i in snap.ids()), snap.vectors(), snap.payloads(), name=staging)
+            loaded = int(vs.client.count(collection_name=staging, exact=True).count)
+            if loaded != m["points"]:
+                raise ValueError(f"{path} holds {loaded} of its {m['points']} points")
+            # One transaction: a corrupt chunk section keeps the old rows
+            tenant.chunk_store.replace_raw(snap.chunk_rows())
+        except Exception:
+            vs.client.delete_collection(staging)
+            raise
+        vs.replace_with(staging)
+    seconds = round(time.perf_counter() - t0, 2)
+    print(f"Imported {m['points']} points from {path} into {vs.collection} in {seconds}s")
+    return {"path": str(path), "seconds": seconds, "replaced": replace, "changed_settings": changed, **_summary(m)}
+
+
+def _summary(manifest: dict) -> dict:
+    return {k: v for k, v in manifest.items() if k != "files"} | {"files": len(manifest["files"])}
+
+
+def list_snapshots() -> List[dict]:
+    out = []
+    for path in sorted(snapshot_dir().glob(f"*{SUFFIX}")):
+        try:
+            out.append({"name": path.name, "bytes": path.stat().st_size, **_summary(Snapshot(path).manifest)})
+        except (OSError, ValueError) as e:
+            out.append({"name": path.name, "error": str(e)})
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    exp = sub.add_parser("export", help="write the tenant's index to a snapshot")
+    exp.add_argument("--tenant", default=None)
+    exp.add_argument("--out", type=Path, default=None)
+    imp = sub.add_parser("import", help="load a snapshot into the tenant's collection")
+    imp.add_argument("path", type=Path)
+    imp.add_argument("--tenant", default=None)
+    imp.add_argument("--merge", action="store_true", help="upsert over the existing points instead of replacing")
+    info = sub.add_parser("info", help="print a snapshot's manifest")
+    info.add_argument("path", type=Path)
+    args = ap.parse_args()
+
+    if args.cmd == "info":
+        print(json.dumps(Snapshot(args.path).manifest, indent=2))
+    elif args.cmd == "export":
+        print(json.dumps(export_snapshot(tenants.get(args.tenant), args.out), indent=2))
+    else:
+        print(json.dumps(import_snapshot(tenants.get(args.tenant), args.path, replace=not args.merge), indent=2))
+
+
+if __name__ == "__main__":
+    main()
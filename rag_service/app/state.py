@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from .config import Settings, settings
+
+
+class StateBackend:
+    """Small JSON key-value store for runtime state shared by all workers."""
+
+    def get(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def items(self, prefix: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def update(self, key: str, fn: Callable[[Any], Any], ttl: Optional[float] = None) -> Any:
+        """Atomically replace the value with fn(current) and return the new value."""
+        raise NotImplementedError
+
+    def purge(self) -> int:
+        """Drop expired entries; returns how many."""
+        raise NotImplementedError
+
+
+class MemoryState(StateBackend):
+    """Process-local state; only correct with a single worker."""
+
+    def __init__(self):
+        self._data: Dict[str, tuple] = {}
+        self._lock = threading.RLock()
+
+    def _live(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] < time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._live(key)
+            return default if entry is None else entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def items(self, prefix: str) -> Dict[str, Any]:
+        with self._lock:
+            return {k: e[0] for k in list(self._data) if k.startswith(prefix) and (e := self._live(k))}
+
+    def update(self, key: str, fn: Callable[[Any], Any], ttl: Optional[float] = None) -> Any:
+        with self._lock:
+            value = fn(self.get(key))
+            self.set(key, value, ttl)
+            return value
+
+    def purge(self) -> int:
+        with self._lock:
+            expired = [k for k in list(self._data) if self._live(k) is None]
+            return len(expired)
+
+
+class SQLiteState(StateBackend):
+    """State in a SQLite file (WAL mode), shared by workers on the same node or volume."""
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=10.0, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, default: Any = None) -> Any:
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires >= ?)", (key, time.time())
+        ).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+            (key, json.dumps(value), time.time() + ttl if ttl else None),
+        )
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def items(self, prefix: str) -> Dict[str, Any]:
+        rows = self._conn().execute(
+            "SELECT key, value FROM kv WHERE key >= ? AND key < ? AND (expires IS NULL OR expires >= ?)",
+            (prefix, prefix + "\uffff", time.time()),
+        )
+        return {k: json.loads(v) for k, v in rows}
+
+    def update(self, key: str, fn: Callable[[Any], Any], ttl: Optional[float] = None) -> Any:
+        conn = self._conn()
+        # IMMEDIATE takes the write lock up front so concurrent updates serialize
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            value = fn(self.get(key))
+            self.set(key, value, ttl)
+            conn.execute("COMMIT")
+            return value
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def purge(self) -> int:
+        return self._conn().execute("DELETE FROM kv WHERE expires < ?", (time.time(),)).rowcount
+
+
+def load_state(cfg: Settings = settings) -> StateBackend:
+    if cfg.state_backend == "memory":
+        return MemoryState()
+    return SQLiteState(cfg.state_path or cfg.data_dir / "state.sqlite")
+
+
+shared_state = load_state()
+
+
+def get_active_model() -> str:
+    """The chat model selected via /models/set-active, falling back to the configured one."""
+    return shared_state.get("llm:active_model") or settings.llm_model
+
+
+def store_active_model(model_name: str) -> None:
+    shared_state.set("llm:active_model", model_name)
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, AsyncIterator, List
+
+from .metrics import metrics
+
+
+_END = object()
+
+
+@dataclass
+class StreamStats:
+    """Tokens read from Ollama versus tokens the client actually received."""
+
+    generated: int = 0
+    delivered: int = 0
+    cancelled: bool = False
+    started: float = field(default_factory=time.perf_counter)
+
+    def report(self) -> dict:
+        return {
+            "tokens_generated": self.generated,
+            "tokens_delivered": self.delivered,
+            "cancelled": self.cancelled,
+            "seconds": round(time.perf_counter() - self.started, 3),
+        }
+
+    def record(self, name: str) -> None:
+        note = " (client disconnected)" if self.cancelled else ""
+        print(f"Stream {name}: {self.generated} tokens generated, {self.delivered} delivered{note}")
+        metrics.add_many(
+            {
+                f"stream.{name}.total": 1,
+                f"stream.{name}.cancelled": int(self.cancelled),
+                f"stream.{name}.tokens_generated": self.generated,
+                f"stream.{name}.tokens_delivered": self.delivered,
+            }
+        )
+
+
+async def relay(upstream: AsyncIterator[str], stats: StreamStats, buffer: int = 32) -> AsyncGenerator[str, None]:
+    """Forward upstream tokens through a bounded queue.
+
+    The reader waits while the queue is full, so a slow client slows reading from
+    Ollama instead of buffering without limit. Closing or cancelling this generator
+    (the client disconnected) cancels the reader, which closes the upstream HTTP
+    request so Ollama stops generating.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, buffer))
+    errors: List[BaseException] = []
+
+    async def pump() -> None:
+        try:
+            async for token in upstream:
+                stats.generated += 1
+                await queue.put(token)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            aclose = getattr(upstream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        await queue.put(_END)
+
+    reader = asyncio.create_task(pump())
+    try:
+        while True:
+            token = await queue.get()
+            if token is _END:
+                break
+            yield token
+            stats.delivered += 1
+        if errors:
+            raise errors[0]
+    except (asyncio.CancelledError, GeneratorExit):
+        stats.cancelled = True
+        raise
+    finally:
+        reader.cancel()
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from typing import Dict, List
+
+from fastapi import HTTPException, Request
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .chunkstore import ChunkStore
+from .config import Settings, settings
+from .embeddings import EmbeddingModel, embedding_pool
+from .vectorstore import VectorStore
+
+
+class Tenant:
+    """A named collection with its own docs root, chunking, embedding model and top_k.
+
+    The vector store and chunk store are opened on first use; the embedding
+    model is looked up in the shared pool on every use so eviction can free it.
+    """
+
+    def __init__(self, name: str, cfg: Settings):
+        self.name = name
+        self.settings = cfg
+        self._vs: VectorStore | None = None
+        self._chunk_store: ChunkStore | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self) -> EmbeddingModel:
+        return embedding_pool.get(self.settings.embedding_model)
+
+    @property
+    def vs(self) -> VectorStore:
+        if self._vs is None:
+            with self._lock:
+                if self._vs is None:
+                    self._vs = VectorStore(self.settings, self.embeddings)
+        return self._vs
+
+    @property
+    def chunk_store(self) -> ChunkStore:
+        if self._chunk_store is None:
+            with self._lock:
+                if self._chunk_store is None:
+                    path = self.settings.data_dir / f"{self.settings.qdrant_collection}.chunks.sqlite"
+                    self._chunk_store = ChunkStore(path)
+        return self._chunk_store
+
+
+def tenant_settings(name: str, base: Settings = settings) -> Settings:
+    if name == base.default_tenant:
+        return base
+    overrides = dict(base.tenants[name] or {})
+    overrides.setdefault("qdrant_collection", name)
+    # A sibling of the default root, never inside it: the default tenant walks its whole tree
+    overrides.setdefault("docs_dir", base.docs_dir.parent / "tenants" / name)
+    # Re-validate so paths and types in the overrides are coerced
+    return Settings(**{**base.model_dump(), **overrides})
+
+
+class TenantRegistry:
+    def __init__(self, cfg: Settings = settings):
+        self.settings = cfg
+        self._tenants: Dict[str, Tenant] = {}
+        self._lock = threading.Lock()
+
+    def names(self) -> List[str]:
+        return [self.settings.default_tenant, *(n for n in self.settings.tenants if n != self.settings.default_tenant)]
+
+    def get(self, name: str | None = None) -> Tenant:
+        name = name or self.settings.default_tenant
+        if name != self.settings.default_tenant and name not in self.settings.tenants:
+            raise KeyError(name)
+        with self._lock:
+            tenant = self._tenants.get(name)
+            if tenant is None:
+                tenant = self._tenants[name] = Tenant(name, tenant_settings(name, self.settings))
+            return tenant
+
+    def nested_roots(self, tenant: Tenant) -> List[Path]:
+        """Docs roots of other tenants configured inside this tenant's root; its walk skips them."""
+        root = tenant.settings.docs_dir
+        return [
+            other
+            for n in self.names()
+            if n != tenant.name and (other := self.get(n).settings.docs_dir) != root and other.is_relative_to(root)
+        ]
+
+
+tenants = TenantRegistry()
+
+
+class TenantPathMiddleware:
+    """Route /t/<tenant>/<path> to /<path> with the tenant recorded in request state."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] in ("http", "websocket") and scope["path"].startswith("/t/"):
+            name, _, rest = scope["path"][3:].partition("/")
+            if name:
+                scope = dict(scope)
+                scope["path"] = "/" + rest
+                scope["raw_path"] = scope["path"].encode("utf-8")
+                scope["state"] = {**scope.get("state", {}), "tenant": name}
+        await self.app(scope, receive, send)
+
+
+def get_tenant(request: Request) -> Tenant:
+    """FastAPI dependency: tenant from the /t/<name> prefix, then the tenant header."""
+    name = getattr(request.state, "tenant", None) or request.headers.get(settings.tenant_header)
+    try:
+        return tenants.get(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown tenant: {name}")
@@ -1,38 +1,252 @@
 from __future__ import annotations
 
-from typing import List, Optional
+import uuid
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Tuple
 
 from qdrant_client import QdrantClient
 from qdrant_client.http import models as qmodels
 
-from .config import settings
+from .config import Settings
+
+if TYPE_CHECKING:
+    from .embeddings import EmbeddingModel
+
+
+# Payload fields that search filters can use, with their index types
+PAYLOAD_INDEXES = {
+    "folders": qmodels.PayloadSchemaType.KEYWORD,
+    "file_type": qmodels.PayloadSchemaType.KEYWORD,
+    "tags": qmodels.PayloadSchemaType.KEYWORD,
+    "source": qmodels.PayloadSchemaType.KEYWORD,
+    "mtime": qmodels.PayloadSchemaType.INTEGER,
+}
+
+
+def quantization_config(cfg: Settings):
+    if cfg.qdrant_quantization == "scalar":
+        return qmodels.ScalarQuantization(
+            scalar=qmodels.ScalarQuantizationConfig(
+                type=qmodels.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=cfg.qdrant_quantization_always_ram,
+            )
+        )
+    if cfg.qdrant_quantization == "product":
+        return qmodels.ProductQuantization(
+            product=qmodels.ProductQuantizationConfig(
+                compression=qmodels.CompressionRatio(cfg.qdrant_pq_compression),
+                always_ram=cfg.qdrant_quantization_always_ram,
+            )
+        )
+    return None
+
+
+def hnsw_config(cfg: Settings) -> Optional[qmodels.HnswConfigDiff]:
+    if cfg.qdrant_hnsw_m is None and cfg.qdrant_hnsw_ef_construct is None:
+        return None
+    return qmodels.HnswConfigDiff(m=cfg.qdrant_hnsw_m, ef_construct=cfg.qdrant_hnsw_ef_construct)
+
+
+def search_params(cfg: Settings) -> Optional[qmodels.SearchParams]:
+    quant = None
+    if cfg.qdrant_quantization:
+        quant = qmodels.QuantizationSearchParams(rescore=cfg.qdrant_rescore, oversampling=cfg.qdrant_oversampling)
+    if quant is None and cfg.qdrant_search_ef is None:
+        return None
+    return qmodels.SearchParams(hnsw_ef=cfg.qdrant_search_ef, quantization=quant)
 
 
 class VectorStore:
-    def __init__(self):
-        self.client = QdrantClient(url=settings.qdrant_url)
-        self.collection = settings.qdrant_collection
-        self._ensure_collection()
+    def __init__(self, cfg: Settings, embeddings: "EmbeddingModel"):
+        self.settings = cfg
+        self.client = QdrantClient(url=cfg.qdrant_url)
+        self.collection = cfg.qdrant_collection
+        self.search_params = search_params(cfg)
+        self._ensure_collection(embeddings)
 
-    def _ensure_collection(self):
+    def _ensure_collection(self, embeddings: "EmbeddingModel"):
         exists = False
         try:
-            info = self.client.get_collection(self.collection)
+            info = self.client.get_collection(self._resolve(self.collection))
             exists = info is not None
         except Exception:
             exists = False
-        if exists and settings.recreate_collection:
-            self.client.delete_collection(self.collection)
+        if exists and self.settings.recreate_collection:
+            self._drop(self.collection)
             exists = False
-        if not exists:
+        if exists:
+            vectors = info.config.params.vectors
+            if isinstance(vectors, qmodels.VectorParams):
+                embeddings.match_dim(vectors.size)
+            indexed = set(info.payload_schema or {})
+        else:
             # Create collection with cosine distance; size from embedding model
-            from .embeddings import embeddings
-
             dim = embeddings.dim
-            self.client.create_collection(
-                collection_name=self.collection,
-                vectors_config=qmodels.VectorParams(size=dim, distance=qmodels.Distance.COSINE),
+            self._create(self.collection, dim)
+            indexed = set()
+        self._ensure_payload_indexes(self.collection, indexed)
+
+    def _ensure_payload_indexes(self, name: str, indexed: set):
+        for field_name, schema in PAYLOAD_INDEXES.items():
+            if field_name not in indexed:
+                self.client.create_payload_index(collection_name=name, field_name=field_name, field_schema=schema)
+
+    def _resolve(self, name: str) -> str:
+        """The collection behind name, which is an alias once a snapshot import has published one."""
+        for alias in self.client.get_aliases().aliases:
+            if alias.alias_name == name:
+                return alias.collection_name
+        return name
+
+    def _drop(self, name: str):
+        """Delete a collection, or an alias together with the collection it points to."""
+        target = self._resolve(name)
+        if target != name:
+            self.client.update_collection_aliases(
+                change_aliases_operations=[qmodels.DeleteAliasOperation(delete_alias=qmodels.DeleteAlias(alias_name=name))]
+            )
+        self.client.delete_collection(target)
+
+    def _create(self, name: str, dim: int):
+        self.client.create_collection(
+            collection_name=name,
+            vectors_config=qmodels.VectorParams(
+                size=dim,
+                distance=qmodels.Distance.COSINE,
+                datatype=qmodels.Datatype(self.settings.qdrant_vector_datatype),
+                on_disk=self.settings.qdrant_on_disk_vectors,
+            ),
+            on_disk_payload=self.settings.qdrant_on_disk_payload,
+            hnsw_config=hnsw_config(self.settings),
+            quantization_config=quantization_config(self.settings),
+        )
+
+    def _copy_points(self, src: str, dst: str, batch: int = 256):
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=src,
+                limit=batch,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
             )
+            if points:
+                self.client.upsert(
+                    collection_name=dst,
+                    points=[qmodels.PointStruct(id=p.id, vector=p.vector, payload=p.payload) for p in points],
+                )
+            if offset is None:
+                break
+
+    def migrate_storage(self) -> dict:
+        """Bring an existing collection in line with the configured storage settings.
+
+        HNSW, quantization and on-disk flags are updated in place (Qdrant rebuilds
+        in the background). A vector datatype change cannot be applied in place, so
+        the points are copied to a new collection that then replaces this one.
+        """
+        physical = self._resolve(self.collection)
+        info = self.client.get_collection(physical)
+        params = info.config.params
+        vectors = params.vectors
+        current_dtype = (getattr(vectors, "datatype", None) or qmodels.Datatype.FLOAT32).value
+        if current_dtype != self.settings.qdrant_vector_datatype:
+            tmp = f"{self.collection}__migrate_{uuid.uuid4().hex[:12]}"
+            self.recreate(vectors.size, name=tmp)
+            self._copy_points(self.collection, tmp)
+            self.replace_with(tmp)
+            return {
+                "collection": self.collection,
+                "action": "recreated",
+                "datatype": self.settings.qdrant_vector_datatype,
+            }
+
+        quant = quantization_config(self.settings)
+        if quant is None and info.config.quantization_config is not None:
+            quant = qmodels.Disabled.DISABLED
+        self.client.update_collection(
+            collection_name=physical,
+            vectors_config={"": qmodels.VectorParamsDiff(on_disk=self.settings.qdrant_on_disk_vectors)},
+            collection_params=qmodels.CollectionParamsDiff(on_disk_payload=self.settings.qdrant_on_disk_payload),
+            hnsw_config=hnsw_config(self.settings),
+            quantization_config=quant,
+        )
+        return {
+            "collection": self.collection,
+            "action": "updated",
+            "quantization": self.settings.qdrant_quantization,
+        }
+
+    def recreate(self, dim: int, name: Optional[str] = None):
+        """Drop the collection and create it empty with the configured storage settings."""
+        name = name or self.collection
+        self._drop(name)
+        self._create(name, dim)
+        self._ensure_payload_indexes(name, set())
+
+    @contextmanager
+    def _indexing_paused(self, name: str):
+        # Building the graph once at the end is much faster than updating it per batch
+        name = self._resolve(name)
+        previous = self.client.get_collection(name).config.optimizer_config.indexing_threshold
+        self.client.update_collection(name, optimizers_config=qmodels.OptimizersConfigDiff(indexing_threshold=0))
+        try:
+            yield
+        finally:
+            self.client.update_collection(
+                name, optimizers_config=qmodels.OptimizersConfigDiff(indexing_threshold=previous)
+            )
+
+    def bulk_load(
+        self, ids: Iterable[int], vectors, payloads: Iterable[dict], batch: int = 512, name: Optional[str] = None
+    ):
+        """Upload many points, with HNSW indexing paused until the upload is done."""
+        name = name or self.collection
+        with self._indexing_paused(name):
+            self.client.upload_collection(
+                collection_name=name, vectors=vectors, payload=payloads, ids=ids, batch_size=batch, wait=True
+            )
+
+    def replace_with(self, staging: str):
+        """Publish a fully loaded staging collection under this collection's name.
+
+        The name becomes an alias of the staging collection; once it is one, later
+        swaps switch the alias atomically and then drop the old collection. A plain
+        collection of that name is deleted right before its alias is created.
+        """
+        old = self._resolve(self.collection)
+        ops = []
+        if old != self.collection:
+            ops.append(qmodels.DeleteAliasOperation(delete_alias=qmodels.DeleteAlias(alias_name=self.collection)))
+        else:
+            self.client.delete_collection(self.collection)
+        ops.append(
+            qmodels.CreateAliasOperation(
+                create_alias=qmodels.CreateAlias(collection_name=staging, alias_name=self.collection)
+            )
+        )
+        self.client.update_collection_aliases(change_aliases_operations=ops)
+        if old != self.collection:
+            self.client.delete_collection(old)
+
+    def scroll_all(
+        self, batch: int = 512, name: Optional[str] = None
+    ) -> Iterator[Tuple[List[int], List[List[float]], List[dict]]]:
+        """Every point with its vector and payload, as (ids, vectors, payloads) batches."""
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                name or self.collection, limit=batch, offset=offset, with_payload=True, with_vectors=True
+            )
+            if points:
+                yield [p.id for p in points], [p.vector for p in points], [p.payload or {} for p in points]
+            if offset is None:
+                return
+
+    def count(self) -> int:
+        return int(self.client.count(collection_name=self.collection, exact=True).count)
 
     def upsert(self, ids: List[int], vectors: List[List[float]], payloads: List[dict]):
         self.client.upsert(
@@ -44,14 +258,63 @@ class VectorStore:
             ),
         )
 
-    def search(self, vector: List[float], top_k: int = 5, filter: Optional[qmodels.Filter] = None):
+    def delete(self, ids: List[int]):
+        if ids:
+            self.client.delete(collection_name=self.collection, points_selector=qmodels.PointIdsList(points=ids))
+
+    def ids_for_sources(self, sources: List[str], batch: int = 1024) -> List[int]:
+        """Ids of the points whose primary source is one of the given paths."""
+        if not sources:
+            return []
+        flt = qmodels.Filter(must=[qmodels.FieldCondition(key="source", match=qmodels.MatchAny(any=sources))])
+        ids: List[int] = []
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                self.collection, scroll_filter=flt, limit=batch, offset=offset, with_payload=False
+            )
+            ids.extend(p.id for p in points)
+            if offset is None:
+                return ids
+
+    def search(
+        self,
+        vector: List[float],
+        top_k: int = 5,
+        filter: Optional[qmodels.Filter] = None,
+        with_vectors: bool = False,
+    ):
         return self.client.search(
             collection_name=self.collection,
             query_vector=vector,
             limit=top_k,
             query_filter=filter,
+            search_params=self.search_params,
             with_payload=True,
+            with_vectors=with_vectors,
         )
 
+    def search_batch(
+        self,
+        vectors: List[List[float]],
+        top_k: int = 5,
+        filters: Optional[List[Optional[qmodels.Filter]]] = None,
+        with_vectors: bool = False,
+    ):
+        """Run many searches in one request; filters are per vector."""
+        filters = filters or [None] * len(vectors)
+        return self.client.search_batch(
+            collection_name=self.collection,
+            requests=[
+                qmodels.SearchRequest(
+                    vector=v,
+                    limit=top_k,
+                    filter=f,
+                    params=self.search_params,
+                    with_payload=True,
+                    with_vector=with_vectors,
+                )
+                for v, f in zip(vectors, filters)
+            ],
+        )
 
-vs = VectorStore()
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import socket
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from .config import Settings, settings
+from .state import get_active_model, shared_state
+
+
+_RECENT_KEY = "warm:recent"
+_LOAD_TIMES_KEY = "warm:load_times"
+_LEADER_KEY = "warm:leader"
+
+
+class WarmPool:
+    """Keeps the active and configured secondary Ollama models loaded.
+
+    Ollama unloads a model keep_alive after its last use and refuses to hold more
+    than OLLAMA_MAX_LOADED_MODELS. The pool preloads models ahead of use (on
+    set-active and periodically), records how long loads take, and when a load
+    needs room unloads the least recently used model outside the warm set.
+    """
+
+    def __init__(self, cfg: Settings = settings):
+        self.cfg = cfg
+        self.base_url = cfg.llm_base_url.rstrip("/")
+        self._touched: Dict[str, float] = {}
+        self._lock: Optional[asyncio.Lock] = None
+
+    def warm_set(self) -> List[str]:
+        models = [get_active_model()]
+        # The routing target for simple questions is as latency critical as the active model
+        extra = ([self.cfg.llm_small_model] if self.cfg.llm_small_model else []) + self.cfg.llm_warm_models
+        models += [m for m in extra if m not in models]
+        return models[: max(1, self.cfg.llm_max_loaded_models)]
+
+    def touch(self, model: str) -> None:
+        """Note a use of the model for eviction order (throttled per worker)."""
+        now = time.time()
+        if now - self._touched.get(model, 0) < 30:
+            return
+        self._touched[model] = now
+        shared_state.update(_RECENT_KEY, lambda cur: {**(cur or {}), model: now})
+
+    async def loaded(self) -> List[dict]:
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            r = await client.get(f"{self.base_url}/api/ps")
+            r.raise_for_status()
+            return r.json().get("models", [])
+
+    async def _set_keep_alive(self, model: str, keep_alive) -> None:
+        # An empty generate only (un)loads the model and sets its keep_alive
+        timeout = httpx.Timeout(self.cfg.llm_load_timeout, connect=10.0)
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            r = await client.post(f"{self.base_url}/api/generate", json={"model": model, "keep_alive": keep_alive})
+            r.raise_for_status()
+
+    async def _make_room(self, model: str, loaded: List[str]) -> Optional[str]:
+        if model in loaded or len(loaded) < self.cfg.llm_max_loaded_models:
+            return None
+        keep = set(self.warm_set()) | {model}
+        recent = shared_state.get(_RECENT_KEY) or {}
+        candidates = sorted((m for m in loaded if m not in keep), key=lambda m: recent.get(m, 0))
+        if not candidates:
+            # Everything loaded is wanted; Ollama will queue or evict on its own
+            return None
+        victim = candidates[0]
+        await self._set_keep_alive(victim, 0)
+        print(f"Unloaded {victim} to make room for {model}")
+        return victim
+
+    async def preload(self, model: str) -> dict:
+        """Load the model (evicting by recency if needed) and return the load time."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            try:
+                loaded = [m.get("name") for m in await self.loaded()]
+            except Exception:
+                loaded = []
+            if model in loaded:
+                # Already resident; refresh its keep_alive
+                await self._set_keep_alive(model, self.cfg.llm_keep_alive)
+                return {"model": model, "already_loaded": True, "seconds": 0.0}
+            evicted = await self._make_room(model, loaded)
+            t0 = time.perf_counter()
+            await self._set_keep_alive(model, self.cfg.llm_keep_alive)
+            seconds = round(time.perf_counter() - t0, 2)
+        self.touch(model)
+        shared_state.update(_LOAD_TIMES_KEY, lambda cur: _record_load(cur or {}, model, seconds))
+        print(f"Preloaded {model} in {seconds}s")
+        return {"model": model, "already_loaded": False, "seconds": seconds, "evicted": evicted}
+
+    async def keep_warm(self) -> None:
+        """Reload any model of the warm set Ollama has dropped."""
+        try:
+            loaded = {m.get("name") for m in await self.loaded()}
+        except Exception as e:
+            print(f"Warm pool: Ollama unreachable ({e})")
+            return
+        for model in self.warm_set():
+            if model not in loaded:
+                try:
+                    await self.preload(model)
+                except Exception as e:
+                    print(f"Warm pool: preloading {model} failed ({e})")
+
+    async def run(self) -> None:
+        """Background loop; one worker at a time holds the lease and does the work."""
+        me = f"{socket.gethostname()}:{os.getpid()}"
+        lease = self.cfg.llm_warm_interval * 2
+        while True:
+            # A dead holder's lease runs out, then another worker takes over
+            if shared_state.get(_LEADER_KEY) in (None, me):
+                holder = shared_state.update(_LEADER_KEY, lambda cur: me if cur in (None, me) else cur, ttl=lease)
+                if holder == me:
+                    await self.keep_warm()
+            await asyncio.sleep(self.cfg.llm_warm_interval)
+
+    async def report(self) -> dict:
+        try:
+            loaded = await self.loaded()
+        except Exception as e:
+            loaded = [{"error": str(e)}]
+        return {
+            "warm_set": self.warm_set(),
+            "max_loaded_models": self.cfg.llm_max_loaded_models,
+            "keep_alive": self.cfg.llm_keep_alive,
+            "loaded": loaded,
+            "load_times": shared_state.get(_LOAD_TIMES_KEY) or {},
+            "last_used": shared_state.get(_RECENT_KEY) or {},
+        }
+
+
+def _record_load(times: dict, model: str, seconds: float) -> dict:
+    entry = times.get(model) or {"count": 0, "total": 0.0}
+    count = entry["count"] + 1
+    total = entry["total"] + seconds
+    times[model] = {"count": count, "total": round(total, 2), "last": seconds, "avg": round(total / count, 2)}
+    return times
+
+
+warm_pool = WarmPool()
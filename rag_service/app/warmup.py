@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+
+from .chunking import token_counter
+from .config import settings
+from .tenants import tenants
+
+
+# Set on import, just before app.main builds the app; a proxy for process start
+STARTED_AT = time.perf_counter()
+
+
+class Readiness:
+    """Tracks background warm-up of models and connections after the app is live."""
+
+    def __init__(self):
+        self.ready = False
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self.warmed: List[str] = []
+
+    def mark(self, name: str, since: float) -> None:
+        self.timings[name] = round(time.perf_counter() - since, 3)
+
+    def report(self) -> dict:
+        return {
+            "status": "ready" if self.ready else "warming",
+            "tenants": self.warmed,
+            "timings": self.timings,
+            "error": self.error,
+        }
+
+
+readiness = Readiness()
+
+
+def require_ready() -> None:
+    """Route dependency: 503 while warming up, rather than loading models inside a request."""
+    if not readiness.ready:
+        raise HTTPException(status_code=503, detail="Warming up, retry shortly", headers={"Retry-After": "5"})
+
+
+def _warm_tenants() -> None:
+    models: List[str] = []
+    for name in tenants.names():
+        tenant = tenants.get(name)
+        model = tenant.settings.embedding_model
+        # Don't warm more distinct models than the pool keeps; the rest load on demand
+        if model not in models and len(models) >= settings.embedding_max_models:
+            continue
+        if model not in models:
+            models.append(model)
+            t0 = time.perf_counter()
+            tenant.embeddings
+            token_counter(tenant.settings.chunk_tokenizer or model)
+            readiness.mark(f"embeddings:{model}", t0)
+        t0 = time.perf_counter()
+        tenant.vs
+        tenant.chunk_store
+        readiness.mark(f"vectorstore:{name}", t0)
+        readiness.warmed.append(name)
+
+
+async def warm_up(retry_delay: float = 2.0, max_delay: float = 30.0) -> None:
+    """Load models and connect to Qdrant off the event loop, retrying until it works."""
+    delay = retry_delay
+    while True:
+        try:
+            await asyncio.to_thread(_warm_tenants)
+            break
+        except Exception as e:
+            readiness.error = str(e)
+            readiness.warmed.clear()
+            print(f"Warm-up failed ({e}), retrying in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+    readiness.error = None
+    readiness.ready = True
+    readiness.mark("ready", STARTED_AT)
+    print(f"Ready in {readiness.timings['ready']}s: {readiness.timings}")
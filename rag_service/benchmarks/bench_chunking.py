@@ -0,0 +1,80 @@
+"""Compare chunk count, boundary quality and throughput of the text splitters.
+
+Run from rag_service/:
+
+    python -m benchmarks.bench_chunking                 # synthetic markdown corpus
+    python -m benchmarks.bench_chunking docs/*.md --mb 0
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from app.chunking import approx_token_counts, chunk_text, default_token_counter
+from app.config import settings
+from app.loaders import simple_text_split
+from app.loaders_old import simple_text_splitter
+
+
+WORDS = (
+    "the policy employee leave request manager approval form days annual sick "
+    "travel expense receipt reimbursement system access password network office "
+    "security badge visitor building floor meeting room booking calendar"
+).split()
+
+
+def synthetic_markdown(target_bytes: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    out: List[str] = []
+    size = 0
+    while size < target_bytes:
+        block = f"## Section {len(out)}\n\n"
+        for _ in range(rng.randint(2, 6)):
+            sentences = [
+                " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 24))).capitalize() + "."
+                for _ in range(rng.randint(1, 8))
+            ]
+            block += " ".join(sentences) + "\n\n"
+        out.append(block)
+        size += len(block)
+    return "".join(out)
+
+
+def run(name: str, split: Callable[[str], List[str]], text: str) -> None:
+    t0 = time.perf_counter()
+    chunks = split(text)
+    dt = time.perf_counter() - t0
+    tokens = approx_token_counts(chunks)
+    clean_end = sum(1 for c in chunks if c.rstrip().endswith((".", "!", "?", ":")))
+    mb = len(text.encode("utf-8")) / 1e6
+    print(
+        f"{name:<22} chunks={len(chunks):>7}  MB/s={mb / dt:>7.2f}  "
+        f"avg_tokens={sum(tokens) / max(1, len(tokens)):>6.1f}  "
+        f"max_tokens={max(tokens, default=0):>5}  clean_ends={clean_end / max(1, len(chunks)):>5.1%}"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("files", nargs="*", type=Path)
+    ap.add_argument("--mb", type=float, default=20.0, help="size of the synthetic corpus")
+    ap.add_argument("--approx", action="store_true", help="skip loading the model tokenizer")
+    args = ap.parse_args()
+
+    parts = [p.read_text(encoding="utf-8", errors="ignore") for p in args.files]
+    if args.mb > 0:
+        parts.append(synthetic_markdown(int(args.mb * 1e6)))
+    text = "\n\n".join(parts)
+    count = approx_token_counts if args.approx else default_token_counter()
+    print(f"corpus: {len(text.encode('utf-8')) / 1e6:.1f} MB, max_tokens={settings.chunk_max_tokens}")
+
+    run("simple_text_split", lambda t: simple_text_split(t, settings.chunk_size, settings.chunk_overlap), text)
+    run("simple_text_splitter", lambda t: simple_text_splitter(t, settings.chunk_size, settings.chunk_overlap), text)
+    run("chunk_text", lambda t: chunk_text(t, count=count), text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Throughput and cosine agreement of the embedding backends against PyTorch fp32.
+
+Run from rag_service/:
+
+    python -m benchmarks.bench_embeddings --n 2000 --threads 4
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from typing import List
+
+import numpy as np
+
+from app.chunking import approx_token_counts, chunk_text
+from app.config import settings
+from app.embeddings import EmbeddingBackend, OnnxBackend, TorchBackend
+
+from .bench_chunking import synthetic_markdown
+
+
+def sample_texts(n: int) -> List[str]:
+    chunks = chunk_text(synthetic_markdown(n * 1500), count=approx_token_counts)
+    return [f"passage: {c}" for c in chunks[:n]]
+
+
+def timed(backend: EmbeddingBackend, texts: List[str]) -> np.ndarray:
+    backend.encode(texts[: backend.batch_size])  # warm-up
+    t0 = time.perf_counter()
+    vecs = backend.encode(texts)
+    dt = time.perf_counter() - t0
+    print(f"{backend.name + (' int8' if getattr(backend, 'quantized', False) else ''):<10} "
+          f"texts/s={len(texts) / dt:>8.1f}  ", end="")
+    return vecs
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--model", default=settings.embedding_model)
+    ap.add_argument("--n", type=int, default=1000)
+    ap.add_argument("--batch-size", type=int, default=settings.embedding_batch_size)
+    ap.add_argument("--threads", type=int, default=settings.embedding_threads)
+    args = ap.parse_args()
+
+    texts = sample_texts(args.n)
+    print(f"model={args.model} texts={len(texts)} batch={args.batch_size} threads={args.threads or 'default'}")
+
+    baseline = timed(TorchBackend(args.model, args.batch_size, args.threads), texts)
+    print("cosine=baseline")
+    for quantize in (False, True):
+        vecs = timed(OnnxBackend(args.model, args.batch_size, args.threads, quantize=quantize), texts)
+        cos = (vecs * baseline).sum(axis=1)
+        print(f"cosine mean={cos.mean():.4f} min={cos.min():.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Memory, latency and recall of Qdrant storage configurations.
+
+Needs a running Qdrant (temporary collections are created and dropped):
+
+    python -m benchmarks.bench_qdrant_storage --url http://localhost:6333 --n 50000
+
+Recall@k is measured against exact (brute-force) search on the float32
+baseline. RAM is estimated from the configuration: full vectors count only
+when not on disk, quantized vectors only when kept in RAM.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Dict, List
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qmodels
+
+from app.config import Settings, settings
+from app.vectorstore import hnsw_config, quantization_config, search_params
+
+
+VARIANTS: Dict[str, dict] = {
+    "float32": {},
+    "float16": {"qdrant_vector_datatype": "float16"},
+    "scalar-int8": {"qdrant_quantization": "scalar"},
+    "scalar-int8+disk": {"qdrant_quantization": "scalar", "qdrant_on_disk_vectors": True},
+    "product-x16": {"qdrant_quantization": "product", "qdrant_pq_compression": "x16"},
+    "product-x16+disk": {
+        "qdrant_quantization": "product",
+        "qdrant_pq_compression": "x16",
+        "qdrant_on_disk_vectors": True,
+    },
+}
+BYTES = {"float32": 4, "float16": 2, "uint8": 1}
+
+
+def clustered_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(8, n // 500), dim))
+    vecs = centers[rng.integers(0, len(centers), n)] + 0.5 * rng.normal(size=(n, dim))
+    return (vecs / np.linalg.norm(vecs, axis=1, keepdims=True)).astype(np.float32)
+
+
+def estimated_ram(cfg: Settings, n: int, dim: int) -> float:
+    ram = 0.0 if cfg.qdrant_on_disk_vectors else n * dim * BYTES[cfg.qdrant_vector_datatype]
+    if cfg.qdrant_quantization == "scalar" and cfg.qdrant_quantization_always_ram:
+        ram += n * dim
+    elif cfg.qdrant_quantization == "product" and cfg.qdrant_quantization_always_ram:
+        ram += n * dim * 4 / int(cfg.qdrant_pq_compression[1:])
+    # HNSW graph: ~2*m links of 4 bytes per point on level 0
+    ram += n * 2 * (cfg.qdrant_hnsw_m or 16) * 4
+    return ram / 1e6
+
+
+def wait_green(client: QdrantClient, name: str) -> None:
+    while client.get_collection(name).status != qmodels.CollectionStatus.GREEN:
+        time.sleep(0.5)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default=settings.qdrant_url)
+    ap.add_argument("--n", type=int, default=50000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    args = ap.parse_args()
+
+    client = QdrantClient(url=args.url, timeout=300)
+    data = clustered_vectors(args.n, args.dim)
+    queries = clustered_vectors(args.queries, args.dim, seed=1)
+    truth: List[set] = []
+
+    print(f"n={args.n} dim={args.dim} queries={args.queries} k={args.k}")
+    for name, overrides in VARIANTS.items():
+        cfg = settings.model_copy(update=overrides)
+        coll = f"bench-storage-{name}"
+        client.delete_collection(coll)
+        client.create_collection(
+            collection_name=coll,
+            vectors_config=qmodels.VectorParams(
+                size=args.dim,
+                distance=qmodels.Distance.COSINE,
+                datatype=qmodels.Datatype(cfg.qdrant_vector_datatype),
+                on_disk=cfg.qdrant_on_disk_vectors,
+            ),
+            hnsw_config=hnsw_config(cfg),
+            quantization_config=quantization_config(cfg),
+        )
+        client.upload_collection(coll, vectors=data, ids=range(args.n), batch_size=512)
+        wait_green(client, coll)
+
+        if not truth:
+            exact = qmodels.SearchParams(exact=True)
+            truth = [
+                {p.id for p in client.search(coll, q.tolist(), limit=args.k, search_params=exact)}
+                for q in queries
+            ]
+
+        params = search_params(cfg)
+        latencies, recall = [], 0.0
+        for q, expected in zip(queries, truth):
+            t0 = time.perf_counter()
+            hits = client.search(coll, q.tolist(), limit=args.k, search_params=params)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            recall += len({h.id for h in hits} & expected) / args.k
+        lat = np.array(latencies)
+        print(
+            f"{name:<18} ram~{estimated_ram(cfg, args.n, args.dim):>8.1f}MB  "
+            f"p50={np.percentile(lat, 50):>6.2f}ms  p95={np.percentile(lat, 95):>6.2f}ms  "
+            f"recall@{args.k}={recall / len(queries):.3f}"
+        )
+        client.delete_collection(coll)
+
+
+if __name__ == "__main__":
+    main()
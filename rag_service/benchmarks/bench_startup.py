@@ -0,0 +1,53 @@
+"""Cold start: time from process spawn until /health (live) and /ready answer.
+
+Run from rag_service/ with the usual RAG_* environment:
+
+    python -m benchmarks.bench_startup --port 8765
+"""
+from __future__ import annotations
+
+import argparse
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def wait_for(url: str, t0: float, timeout: float) -> float:
+    while time.perf_counter() - t0 < timeout:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return time.perf_counter() - t0
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(url)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--timeout", type=float, default=600.0)
+    args = ap.parse_args()
+
+    base = f"http://127.0.0.1:{args.port}"
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        live = wait_for(f"{base}/health", t0, args.timeout)
+        ready = wait_for(f"{base}/ready", t0, args.timeout)
+        report = httpx.get(f"{base}/ready").json()
+    finally:
+        proc.terminate()
+        proc.wait()
+    print(f"live after {live:.2f}s, ready after {ready:.2f}s")
+    print(f"in-process timings: {report['timings']}")
+
+
+if __name__ == "__main__":
+    main()